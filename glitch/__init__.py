@@ -1,3 +1,5 @@
+__version__ = "0.1.0"
+
 from .image_glitch import (
     move_channel,
     move_channels_random,
@@ -6,6 +8,9 @@ from .image_glitch import (
     flip_block,
     salt_and_pepper,
     swap_block_arbitrary_size,
+    scale_block,
+    noise_mask,
+    apply_noise_mask,
 )
 
 from .video_utils import (
@@ -13,4 +18,13 @@ from .video_utils import (
     start_ffmpeg_reader,
     read_frame,
     get_video_size,
+    get_video_info,
+    iter_frames,
+    get_frame_times,
+    concat_videos,
+    decode_frames,
+    FrameReader,
+    FrameWriter,
 )
+
+from .frame_cache import FrameCache
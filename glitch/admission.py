@@ -0,0 +1,191 @@
+""" admission control and adaptive quality of the glitch jobs """
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+import threading
+import time
+
+# (max width or height, max fps, max cost) of the jobs depending on the jobs in the queue.
+# Level i is used when there are at least i * `degrade_every` jobs queued or running, jobs
+# are rendered as they are while the server is idle
+QUALITY_LEVELS = [
+    (None, None, None),
+    (1280, 30, 2000.0),
+    (854, 24, 1000.0),
+    (640, 15, 500.0),
+]
+
+RECENT_JOBS = 100
+
+
+class JobRejected(Exception):
+    """ the job can not be accepted, because it is too big or the server is too busy """
+
+
+class AdmissionController:
+    """ Limits the jobs running at the same time to `max_running`, with at most `max_queued`
+    waiting. Videos longer than `max_frames` are rejected. The cost of a job is its number
+    of megapixels times its number of frames (one for still images). As the queue gets
+    deeper the size and fps of the outputs are limited and bigger jobs than the max cost
+    are scaled down, following `QUALITY_LEVELS` """
+
+    def __init__(
+        self,
+        max_running: int = 2,
+        max_queued: int = 8,
+        max_frames: int = 9000,
+        degrade_every: int = 2,
+        quality_levels: List[
+            Tuple[Optional[int], Optional[float], Optional[float]]
+        ] = QUALITY_LEVELS,
+    ):
+        self.max_queued = max_queued
+        self.max_frames = max_frames
+        self.degrade_every = degrade_every
+        self.quality_levels = quality_levels
+
+        self._slots = threading.Semaphore(max_running)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._counts = {"accepted": 0, "rejected": 0, "degraded": 0}
+        # (cost, seconds) of the last jobs
+        self._recent = deque(maxlen=RECENT_JOBS)
+
+    @staticmethod
+    def job_cost(width: int, height: int, num_frames: int = 1) -> float:
+        return width * height * num_frames / 1e6
+
+    def _quality_level(
+        self, depth: int
+    ) -> Tuple[Optional[int], Optional[float], Optional[float]]:
+        return self.quality_levels[
+            min(depth // self.degrade_every, len(self.quality_levels) - 1)
+        ]
+
+    def _scale(
+        self,
+        width: int,
+        height: int,
+        num_frames: float,
+        max_side: Optional[int],
+        max_cost: Optional[float],
+    ) -> float:
+        """ scale of the frames to fit in `max_side` and `max_cost` """
+        scale = 1.0
+        if max_side is not None:
+            scale = min(scale, max_side / max(width, height))
+        # scale down what is still too expensive
+        cost = self.job_cost(width * scale, height * scale, num_frames)
+        if max_cost is not None and cost > max_cost:
+            scale *= (max_cost / cost) ** 0.5
+        return scale
+
+    def plan_video(self, info: dict, depth: int) -> dict:
+        """ size and fps to render a video of `get_video_info` with `depth` jobs ahead.
+        None if the original is kept """
+        if info["num_frames"] > self.max_frames:
+            raise JobRejected(
+                f"the video has {info['num_frames']} frames, max is {self.max_frames}"
+            )
+        width, height, fps = info["width"], info["height"], info["fps"]
+        max_side, max_fps, max_cost = self._quality_level(depth)
+
+        new_fps = fps
+        if max_fps is not None and fps > max_fps:
+            new_fps = max_fps
+        num_frames = info["num_frames"] * (new_fps / fps if fps else 1)
+        scale = self._scale(width, height, num_frames, max_side, max_cost)
+
+        plan = {"size": None, "fps": None if new_fps == fps else new_fps}
+        if scale < 1.0:
+            # yuv420p needs even sizes
+            plan["size"] = (
+                max(2, int(width * scale) // 2 * 2),
+                max(2, int(height * scale) // 2 * 2),
+            )
+        return plan
+
+    def plan_image(self, info: dict, depth: int) -> dict:
+        """ size to render an image, or an animation of it, with `depth` jobs ahead. `info`
+        has the `width`, `height` and `num_frames` of the output. None if the original is
+        kept """
+        if info["num_frames"] > self.max_frames:
+            raise JobRejected(
+                f"the animation has {info['num_frames']} frames, max is {self.max_frames}"
+            )
+        width, height = info["width"], info["height"]
+        max_side, _, max_cost = self._quality_level(depth)
+        scale = self._scale(width, height, info["num_frames"], max_side, max_cost)
+
+        plan = {"size": None}
+        if scale < 1.0:
+            plan["size"] = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return plan
+
+    @contextmanager
+    def job(
+        self, video_info: Optional[dict] = None, image_info: Optional[dict] = None
+    ) -> Iterator[dict]:
+        """ admits a job, waits for a free slot and yields how to render it: the `size` and
+        `fps` for `glitch_video` of a video of `video_info`, or the `size` for
+        `glitch_image` or `glitch_animation` of an image of `image_info`, see `plan_image`.
+        Raises `JobRejected` """
+        info = video_info or image_info
+        with self._lock:
+            depth = self._queued + self._running
+            try:
+                if self._queued >= self.max_queued:
+                    raise JobRejected("too many jobs queued, try again later")
+                if video_info is not None:
+                    plan = self.plan_video(video_info, depth)
+                elif image_info is not None:
+                    plan = self.plan_image(image_info, depth)
+                else:
+                    plan = {}
+            except JobRejected:
+                self._counts["rejected"] += 1
+                raise
+            self._counts["accepted"] += 1
+            if plan.get("size") or plan.get("fps"):
+                self._counts["degraded"] += 1
+            self._queued += 1
+
+        if info is None:
+            cost = 0.0
+        else:
+            width, height = plan["size"] or (info["width"], info["height"])
+            ratio = plan["fps"] / info["fps"] if plan.get("fps") else 1
+            cost = self.job_cost(width, height, info["num_frames"] * ratio)
+
+        with self._slots:
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            started = time.time()
+            try:
+                yield plan
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._recent.append((cost, time.time() - started))
+
+    def metrics(self) -> dict:
+        """ queue depth and cost of the jobs, to size the capacity """
+        with self._lock:
+            recent = list(self._recent)
+            metrics = {
+                "queued": self._queued,
+                "running": self._running,
+                "queue_depth": self._queued + self._running,
+                **self._counts,
+            }
+        total_cost = sum(cost for cost, _ in recent)
+        total_seconds = sum(seconds for _, seconds in recent)
+        metrics["recent_jobs"] = len(recent)
+        metrics["recent_mean_cost"] = total_cost / len(recent) if recent else 0.0
+        metrics["recent_mean_seconds"] = total_seconds / len(recent) if recent else 0.0
+        # megapixel frames rendered per second of work
+        metrics["throughput"] = total_cost / total_seconds if total_seconds else 0.0
+        return metrics
@@ -0,0 +1,60 @@
+""" writing animations and image sequences """
+
+from typing import List
+import os.path as osp
+
+import imageio
+import numpy as np
+from PIL import Image
+
+NumpyArray = np.ndarray  # for typing
+
+ANIMATION_EXTENSIONS = ["gif", "webp"]
+
+
+def write_animation(frames: List[NumpyArray], output_path: str, fps: float) -> None:
+    """ writes looping frames as an animated gif or webp, depending on the extension of
+    output_path. A path with a %d pattern, like frame_%04d.png, writes an image sequence """
+    if "%" in osp.basename(output_path):
+        write_image_sequence(frames, output_path)
+        return
+
+    extension = osp.splitext(output_path)[1][1:].lower()
+    if extension == "gif":
+        write_gif(frames, output_path, fps)
+    elif extension == "webp":
+        write_webp(frames, output_path, fps)
+    else:
+        raise ValueError(f"animations must be one of {ANIMATION_EXTENSIONS}")
+
+
+def write_gif(frames: List[NumpyArray], output_path: str, fps: float) -> None:
+    """ the palette is computed once, from the first frame, and all the frames are mapped
+    to it without dithering. Computing a palette per frame is most of the encoding time """
+    palette = Image.fromarray(frames[0]).quantize(colors=256)
+    images = [
+        Image.fromarray(frame).quantize(palette=palette, dither=0) for frame in frames
+    ]
+    images[0].save(
+        output_path,
+        save_all=True,
+        append_images=images[1:],
+        duration=int(1000 / fps),
+        loop=0,
+    )
+
+
+def write_webp(frames: List[NumpyArray], output_path: str, fps: float) -> None:
+    images = [Image.fromarray(frame) for frame in frames]
+    images[0].save(
+        output_path,
+        save_all=True,
+        append_images=images[1:],
+        duration=int(1000 / fps),
+        loop=0,
+    )
+
+
+def write_image_sequence(frames: List[NumpyArray], output_pattern: str) -> None:
+    for frame_idx, frame in enumerate(frames):
+        imageio.imwrite(output_pattern % frame_idx, frame)
@@ -1,21 +1,29 @@
+from typing import Iterable, Iterator, List, Optional, Tuple
+
 import imageio
 import numpy as np
-from random import choice
+from PIL import Image
 
 from .image_glitch import (
+    scale_block,
     move_random_blocks,
     move_channels_random,
     salt_and_pepper,
+    noise_mask,
+    apply_noise_mask,
     swap_block,
     scanlines,
     move_channel,
 )
 from .video_utils import (
     get_video_size,
-    start_ffmpeg_reader,
-    start_ffmpeg_writer,
-    read_frame,
+    decode_frames,
+    FrameWriter,
 )
+from .animation_utils import write_animation
+from .frame_cache import FrameCache
+from .recipe import code_version, load_recipe, save_recipe
+from . import __version__
 
 NumpyArray = np.ndarray  # for typing
 
@@ -31,13 +39,26 @@ def glitch_image(
     noise_intensity: float = 0.5,
     noise_amount: float = 0.5,
     channels_movement: float = 0.5,
+    seed: Optional[int] = None,
+    recipe_path: Optional[str] = None,
+    size: Optional[Tuple[int, int]] = None,
+    output_size: Optional[Tuple[int, int]] = None,
 ) -> None:
     """ swaps some random blocks, random moves channels and adds salt and pepper noise to the image
+    The same `seed` always produces the same glitches, if None a random one is used. If
+    `recipe_path` is given the recipe of the render is saved there, see `replay_recipe`.
+    The image can be scaled to `size` (width, height) before glitching it, and the glitched
+    image to `output_size`
     """
-    image = imageio.imread(input_path)
+    if seed is None:
+        seed = np.random.randint(2 ** 31)
+    # a random state of the render, the global one is shared by the threads of the app
+    rng = np.random.RandomState(seed)
+
+    image = read_image(input_path, size)
 
     if block_count and block_size:
-        size = int(min(image.shape[0], image.shape[1]) / 2 * block_size)
+        max_side = int(min(image.shape[0], image.shape[1]) / 2 * block_size)
 
         blocks_moved = 0
 
@@ -46,28 +67,86 @@ def glitch_image(
 
             # Move blocks with given aspect ratio
             num_blocks = (
-                np.random.randint(1, remaining_blocks) if remaining_blocks > 1 else 1
+                rng.randint(1, remaining_blocks) if remaining_blocks > 1 else 1
             )
 
             blocks_moved += num_blocks
 
-            aspect = choice(ASPECT_RATIOS)
-            max_blocksize = [x * size for x in aspect]
+            aspect = ASPECT_RATIOS[rng.randint(len(ASPECT_RATIOS))]
+            max_blocksize = [x * max_side for x in aspect]
             image = move_random_blocks(
                 image,
                 max_blocksize=max_blocksize,
                 num_blocks=num_blocks,
                 per_channel=True,
+                rng=rng,
             )
 
     if channels_movement:
         delta = int(channels_movement * 20)
-        image = move_channels_random(image, -delta, delta)
+        image = move_channels_random(image, -delta, delta, rng)
 
     if noise_intensity and noise_amount:
-        image = salt_and_pepper(image, noise_intensity, 1 - noise_amount)
+        image = salt_and_pepper(image, noise_intensity, 1 - noise_amount, rng)
+
+    imageio.imwrite(output_path, scale_output(image, output_size))
+
+    if recipe_path is not None:
+        params = {
+            "block_size": block_size,
+            "block_count": block_count,
+            "noise_intensity": noise_intensity,
+            "noise_amount": noise_amount,
+            "channels_movement": channels_movement,
+        }
+        save_recipe(
+            recipe_path, recipe_metadata("image", seed, params, size=size), []
+        )
+
 
-    imageio.imwrite(output_path, image)
+def scale_output(
+    frame: NumpyArray, output_size: Optional[Tuple[int, int]] = None
+) -> NumpyArray:
+    """ the glitched frame, scaled to `output_size` (width, height) if given """
+    if output_size is None:
+        return frame
+    width, height = output_size
+    return scale_block(frame, (height, width), "bilinear")
+
+
+def read_image(input_path: str, size: Optional[Tuple[int, int]] = None) -> NumpyArray:
+    """ the image, scaled to `size` (width, height) if given """
+    image = imageio.imread(input_path)
+    if size is not None and tuple(size) != (image.shape[1], image.shape[0]):
+        image = np.asarray(Image.fromarray(image).resize(tuple(size), Image.BILINEAR))
+    return image
+
+
+VIDEO_DEFAULTS = {
+    "min_effect_length": 1,
+    "max_effect_length": 15,
+    "noise_intensity": 0.5,
+    "noise_amount": 0.5,
+    "block_size": 0.5,
+    "block_count": 15,
+    "channels_movement": 0.5,
+    "scanlines_intensity": 0.5,
+}
+
+# roll of the effect swapping the same blocks in all its frames
+STATIC_BLOCKS_ROLL = 2
+
+NOISE_POOL_SIZE = 8
+
+# parameters that decide which effect is applied on each frame. The rest only change how
+# strong the effect is and can be overriden for a range of frames
+SCHEDULE_PARAMS = [
+    "min_effect_length",
+    "max_effect_length",
+    "channels_movement",
+    "block_count",
+    "block_size",
+]
 
 
 def glitch_video(
@@ -81,6 +160,13 @@ def glitch_video(
     block_count: int = 15,
     channels_movement: float = 0.5,
     scanlines_intensity: float = 0.5,
+    seed: Optional[int] = None,
+    frame_cache: Optional[FrameCache] = None,
+    size: Optional[Tuple[int, int]] = None,
+    fps: Optional[float] = None,
+    recipe_path: Optional[str] = None,
+    effects: Optional[List[dict]] = None,
+    output_size: Optional[Tuple[int, int]] = None,
 ) -> None:
     """ glitches a video. 
     Different types of glitches are applied to chunks of the video. Each glitch
@@ -92,16 +178,222 @@ def glitch_video(
     * swap random blocks of the video, random blocks every time
     * salt and pepper noise
     * scanlines effect
+    The same `seed` always produces the same glitches, if None a random one is used.
+    If a `frame_cache` is given the decoded frames are read from it. The output can be
+    scaled to `size` (width, height) and resampled to `fps`, the frame cache is not used
+    then. The glitched frames can be scaled to `output_size`. If `recipe_path` is given the
+    recipe of the render is saved there, see `replay_recipe`. `effects` replaces the random
+    effects, see `glitch_frames`.
     """
-    width, height = get_video_size(input_path)
-    reader = start_ffmpeg_reader(input_path)
-    writer = start_ffmpeg_writer(output_path, width, height)
+    if seed is None:
+        seed = np.random.randint(2 ** 31)
 
-    # each glitch (effect) happens during some frames
-    remaining_frames_effect = 0
-    frame_idx = 0
+    width, height = size or get_video_size(input_path)
+    if frame_cache is None or size is not None or fps is not None:
+        frames = decode_frames(
+            input_path, width, height, resize=size is not None, fps=fps
+        )
+    else:
+        frames = frame_cache.frames(input_path, width, height)
+
+    params = {
+        "min_effect_length": min_effect_length,
+        "max_effect_length": max_effect_length,
+        "noise_intensity": noise_intensity,
+        "noise_amount": noise_amount,
+        "block_size": block_size,
+        "block_count": block_count,
+        "channels_movement": channels_movement,
+        "scanlines_intensity": scanlines_intensity,
+    }
+    timeline = None if recipe_path is None else []
+    frames = glitch_frames(frames, seed, effects=effects, timeline=timeline, **params)
+    output_width, output_height = output_size or (width, height)
+    with FrameWriter(output_path, output_width, output_height, fps=fps) as writer:
+        for frame_idx, frame in enumerate(frames):
+            if frame_idx % 100 == 0:
+                print(f"frame {frame_idx}")
+            writer.write(scale_output(frame, output_size))
+
+    if recipe_path is not None:
+        metadata = recipe_metadata("video", seed, params, size=size, fps=fps)
+        save_recipe(recipe_path, metadata, timeline)
+
+
+def glitch_animation(
+    input_path: str,
+    output_path: str,
+    num_frames: int = 30,
+    fps: float = 15.0,
+    seed: Optional[int] = None,
+    recipe_path: Optional[str] = None,
+    effects: Optional[List[dict]] = None,
+    size: Optional[Tuple[int, int]] = None,
+    output_size: Optional[Tuple[int, int]] = None,
+    **params,
+) -> None:
+    """ glitches `num_frames` frames of an image, with the effects of `glitch_video`
+    changing along the frames, and writes them as a looping animation, see
+    `write_animation` for the output formats. `params` are the ones of `glitch_video`. The
+    image is decoded once, and scaled to `size` (width, height) if given. The glitched
+    frames are scaled to `output_size` """
+    if seed is None:
+        seed = np.random.randint(2 ** 31)
+
+    image = read_image(input_path, size)
+    if image.ndim == 2:
+        image = np.dstack([image] * 3)
+    image = np.ascontiguousarray(image[..., :3])  # no alpha in animations
+
+    params = {**VIDEO_DEFAULTS, **params}
+    timeline = None if recipe_path is None else []
+    frames = glitch_frames(
+        (image for _ in range(num_frames)),
+        seed,
+        effects=effects,
+        timeline=timeline,
+        **params,
+    )
+    write_animation(
+        [scale_output(frame, output_size).astype(np.uint8) for frame in frames],
+        output_path,
+        fps,
+    )
+
+    if recipe_path is not None:
+        metadata = recipe_metadata(
+            "animation", seed, params, num_frames=num_frames, fps=fps, size=size
+        )
+        save_recipe(recipe_path, metadata, timeline)
+
+
+def recipe_metadata(file_type: str, seed: int, params: dict, **render) -> dict:
+    return {
+        "file_type": file_type,
+        "version": __version__,
+        "code_version": code_version(),
+        "seed": int(seed),
+        "params": params,
+        **render,
+    }
+
+
+def replay_recipe(
+    recipe_path: str,
+    input_path: str,
+    output_path: str,
+    size: Optional[Tuple[int, int]] = None,
+) -> None:
+    """ renders again the output of a recipe saved by `glitch_image`, `glitch_video` or
+    `glitch_animation`. Videos and animations reuse the effects in the recipe instead of
+    rolling them. The blocks, noise and vibration are rolled for the dimensions of the
+    frames, so the render is always done at the size of the recipe, and then scaled to
+    `size` (width, height) if given. The output may differ if the recipe was saved by a
+    different version of the code """
+    metadata, timeline = load_recipe(recipe_path)
+    if metadata.get("code_version") != code_version():
+        print(
+            f"Recipe from version {metadata['version']} "
+            f"({metadata.get('code_version')}), output may differ"
+        )
+    params = metadata["params"]
+
+    if metadata["file_type"] == "image":
+        glitch_image(
+            input_path,
+            output_path,
+            seed=metadata["seed"],
+            size=metadata.get("size"),
+            output_size=size,
+            **params,
+        )
+        return
+
+    if metadata["file_type"] == "animation":
+        glitch_animation(
+            input_path,
+            output_path,
+            num_frames=metadata["num_frames"],
+            fps=metadata["fps"],
+            seed=metadata["seed"],
+            effects=timeline,
+            size=metadata.get("size"),
+            output_size=size,
+            **params,
+        )
+        return
+
+    glitch_video(
+        input_path,
+        output_path,
+        seed=metadata["seed"],
+        size=metadata["size"],
+        fps=metadata["fps"],
+        effects=timeline,
+        output_size=size,
+        **params,
+    )
+
+
+def glitch_frames(
+    frames: Iterable[NumpyArray],
+    seed: int,
+    start_frame: int = 0,
+    overrides: Optional[List[Tuple[int, int, dict]]] = None,
+    effects: Optional[Iterable[dict]] = None,
+    timeline: Optional[List[dict]] = None,
+    **params,
+) -> Iterator[NumpyArray]:
+    """ glitches the frames of a video, the first one being frame number `start_frame`.
+    `params` are the ones of `glitch_video`. `overrides` is a list of (start, end, params)
+    that replace the params in the frames [start, end), except for the `SCHEDULE_PARAMS`.
+    Every frame only depends on the seed, its number and its params, so any segment of a
+    video can be rendered on its own and matches the full render.
+    The effects are the ones of `effect_schedule` unless `effects` are given. If `timeline`
+    is given, the effects used are appended to it """
+    params = {**VIDEO_DEFAULTS, **params}
+    if effects is None:
+        schedule = effect_schedule(seed, **{key: params[key] for key in SCHEDULE_PARAMS})
+    else:
+        schedule = iter(effects)
+    roll_options = get_roll_options(
+        params["channels_movement"], params["block_count"], params["block_size"]
+    )
+
+    cache = EffectCache(seed)
+
+    effect = {"start": 0, "length": 0}
+    for frame_idx, frame in enumerate(frames, start_frame):
+        while frame_idx >= effect["start"] + effect["length"]:
+            effect = next(schedule, None)
+            if effect is None:
+                raise ValueError(f"no effect for frame {frame_idx}")
+        if timeline is not None and (not timeline or timeline[-1] is not effect):
+            timeline.append(effect)
+
+        frame_params = get_frame_params(params, overrides, frame_idx)
+        cache.prepare(effect, frame.shape, roll_options, frame_params)
+        yield glitch_frame(
+            frame,
+            effect,
+            frame_idx - effect["start"] + 1,
+            roll_options,
+            noise_intensity=frame_params["noise_intensity"],
+            noise_amount=frame_params["noise_amount"],
+            block_size=frame_params["block_size"],
+            block_count=frame_params["block_count"],
+            channels_movement=frame_params["channels_movement"],
+            scanlines_intensity=frame_params["scanlines_intensity"],
+            cache=cache,
+            # a random state per frame, not the global one shared by the threads
+            rng=np.random.RandomState([seed, frame_idx]),
+        )
 
-    roll_options = {
+
+def get_roll_options(
+    channels_movement: float, block_count: int, block_size: float
+) -> dict:
+    return {
         "nothing": [0],
         "vibrate": ([1] if channels_movement else []),
         "channels_progressive": ([0, 5] if channels_movement else []),
@@ -109,84 +401,208 @@ def glitch_video(
         "blocks": ([2, 3, 5] if block_count and block_size else []),
     }
 
+
+def effect_schedule(
+    seed: int,
+    min_effect_length: int = 1,
+    max_effect_length: int = 15,
+    channels_movement: float = 0.5,
+    block_count: int = 15,
+    block_size: float = 0.5,
+) -> Iterator[dict]:
+    """ yields the effects of a video in order, forever. Each effect is a dict with the
+    `start` frame, its `length` in frames, the `roll` deciding the effect, the `roll_noise`
+    deciding if noise is added and the `channel_directions` of the progressive movement """
+    rng = np.random.RandomState(seed)
+    roll_options = get_roll_options(channels_movement, block_count, block_size)
+    rolls = [value for options in roll_options.values() for value in options]
+
+    frame_idx = 0
+    channel_directions = np.zeros((3, 2), int)
     while True:
-        if frame_idx % 100 == 0:
-            print(f"frame {frame_idx}")
-
-        frame = read_frame(reader, width, height)
-        if frame is None:
-            # no more frames
-            break
-        if not remaining_frames_effect:
-            remaining_frames_effect = np.random.randint(
-                min_effect_length, max_effect_length
-            )
-            current_effect_frame = 1
+        remaining_frames_effect = rng.randint(min_effect_length, max_effect_length)
 
-            # roll for next effect: noise and block swapping
-            rolls = [value for options in roll_options.values() for value in options]
+        # roll for next effect: noise and block swapping
+        roll = rng.randint(max(rolls) * 2 + 1)
 
-            roll = np.random.randint(max(rolls) * 2 + 1)
+        # 0 -> nothing
+        if frame_idx < 5:
+            roll = 0
 
-            # 0 -> nothing
-            if frame_idx < 5:
-                roll = 0
+        # 1 -> "vibrate channels"
+        if roll in roll_options["vibrate"]:
+            remaining_frames_effect = 5
 
-            # 1 -> "vibrate channels"
-            if roll in roll_options["vibrate"]:
-                remaining_frames_effect = 5
+        # 2 -> swap blocks static
+        # 3 -> swap blocks random
 
-            # 2 -> swap blocks static
-            # 3 -> swap blocks random
+        # 4, 5 -> move channels progresively
+        if roll in roll_options["channels"]:
+            channel_directions = rng.randint(-6, 6, (3, 2))
+            remaining_frames_effect = rng.randint(min_effect_length, max_effect_length)
 
-            # 4, 5 -> move channels progresively
-            if roll in roll_options["channels"]:
-                channel_directions = np.random.randint(-6, 6, (3, 2))
-                remaining_frames_effect = np.random.randint(
-                    min_effect_length, max_effect_length
-                )
+        # 5 -> channels and blocks
 
-            # 5 -> channels and blocks
+        roll_noise = rng.randint(0, 3)
+        # if 0 or 1 noise
 
-            roll_noise = np.random.randint(0, 3)
-            # if 0 or 1 noise
-        else:
-            remaining_frames_effect -= 1
-            current_effect_frame += 1
+        # the effect lasts the frame it is rolled plus the remaining ones
+        length = remaining_frames_effect + 1
+        yield {
+            "start": frame_idx,
+            "length": length,
+            "roll": roll,
+            "roll_noise": roll_noise,
+            "channel_directions": channel_directions,
+        }
+        frame_idx += length
 
-        frame_orig = frame
-        frame = frame.copy()
 
-        if roll in roll_options["vibrate"]:
-            frame = apply_random_channel_movement(frame, channels_movement)
+def get_frame_params(
+    params: dict, overrides: Optional[List[Tuple[int, int, dict]]], frame_idx: int
+) -> dict:
+    """ params of the given frame, the last matching override wins """
+    frame_params = params
+    for start, end, override in overrides or []:
+        if start <= frame_idx < end:
+            frame_params = {**frame_params, **override}
+    return frame_params
 
-        if roll in roll_options["channels"]:
-            frame = apply_progressive_channel_movement(
-                frame, channels_movement, channel_directions, current_effect_frame
-            )
 
-        if roll in roll_options["blocks"]:
-            effect = apply_effect_config(width, height, block_count, block_size)
-            frame = apply_block_swap(frame_orig, frame, effect)
+def glitch_frame(
+    frame: NumpyArray,
+    effect: dict,
+    current_effect_frame: int,
+    roll_options: dict,
+    noise_intensity: float,
+    noise_amount: float,
+    block_size: float,
+    block_count: int,
+    channels_movement: float,
+    scanlines_intensity: float,
+    cache: Optional["EffectCache"] = None,
+    rng: Optional[np.random.RandomState] = None,
+) -> NumpyArray:
+    """ applies an effect of `effect_schedule` to a frame. The frame is not modified. With a
+    `cache` prepared for the frame, static blocks and noise masks are taken from it. Random
+    values are drawn from `rng`, or the global random state if None """
+    rng = rng or np.random
+    height, width = frame.shape[:2]
+    roll = effect["roll"]
+
+    frame_orig = frame
+    frame = frame.copy()
 
-        if noise_intensity and noise_amount and roll_noise in [0, 1]:
-            frame = apply_salt_and_pepper(frame, noise_intensity, noise_amount)
+    if channels_movement and roll in roll_options["vibrate"]:
+        frame = apply_random_channel_movement(frame, channels_movement, rng)
+
+    if channels_movement and roll in roll_options["channels"]:
+        frame = apply_progressive_channel_movement(
+            frame,
+            channels_movement,
+            effect["channel_directions"],
+            current_effect_frame,
+        )
 
-        if scanlines_intensity and scanlines_size:
-            frame = scanlines(
-                frame,
-                intensity=scanlines_intensity,
-                band_size=scanlines_size,
-                band_spacing=scanlines_spacing,
+    if block_count and block_size and roll in roll_options["blocks"]:
+        if cache is not None and roll == STATIC_BLOCKS_ROLL:
+            frame = apply_block_remap(frame_orig, frame, cache.block_remap)
+        else:
+            config = apply_effect_config(width, height, block_count, block_size, rng)
+            frame = apply_block_swap(frame_orig, frame, config)
+
+    if noise_intensity and noise_amount and effect["roll_noise"] in [0, 1]:
+        if cache is not None:
+            noise_idxs, noise_values = cache.noise_mask(
+                frame.shape[:2], noise_amount, rng
             )
+            frame = apply_noise_mask(frame, noise_idxs, noise_values, noise_intensity)
+        else:
+            frame = apply_salt_and_pepper(frame, noise_intensity, noise_amount, rng)
 
-        writer.stdin.write(frame.astype(np.uint8).tobytes())
-        frame_idx += 1
+    if scanlines_intensity:
+        frame = scanlines(frame, intensity=scanlines_intensity, rng=rng)
 
-    # cleanup
-    reader.wait()
-    writer.stdin.close()
-    writer.wait()
+    return frame
+
+
+class EffectCache:
+    """ state reused by the frames of a video instead of computing it on every frame:
+    * the blocks of the static block swap, as an index map, for the whole effect
+    * a pool of noise masks, each frame draws one of them
+    Everything is generated from the seed of the video and the start of the effect, not
+    from the first frame it is used in, so segments of a video get the same state """
+
+    def __init__(self, seed: int, noise_pool_size: int = NOISE_POOL_SIZE):
+        self.seed = seed
+        self.noise_pool_size = noise_pool_size
+        self.block_remap = None
+        self._block_remap_key = None
+        self._noise_pools = {}
+
+    def prepare(
+        self, effect: dict, shape: Tuple[int, ...], roll_options: dict, params: dict
+    ) -> None:
+        """ builds what the frame needs """
+        height, width = shape[:2]
+        block_count, block_size = params["block_count"], params["block_size"]
+        if (
+            block_count
+            and block_size
+            and effect["roll"] == STATIC_BLOCKS_ROLL
+            and effect["roll"] in roll_options["blocks"]
+        ):
+            key = (effect["start"], shape, block_count, block_size)
+            if key != self._block_remap_key:
+                rng = np.random.RandomState([self.seed, effect["start"], 1])
+                config = apply_effect_config(
+                    width, height, block_count, block_size, rng
+                )
+                self.block_remap = compile_block_swap(config, shape)
+                self._block_remap_key = key
+
+        noise_amount = params["noise_amount"]
+        if params["noise_intensity"] and noise_amount:
+            key = ((height, width), noise_amount)
+            if key not in self._noise_pools:
+                rng = np.random.RandomState([self.seed, 2])
+                self._noise_pools[key] = [
+                    noise_mask((height, width), 1 - noise_amount, rng)
+                    for _ in range(self.noise_pool_size)
+                ]
+
+    def noise_mask(
+        self,
+        shape: Tuple[int, int],
+        noise_amount: float,
+        rng: Optional[np.random.RandomState] = None,
+    ) -> Tuple[NumpyArray, NumpyArray]:
+        """ one of the masks of the pool, drawn from `rng` """
+        pool = self._noise_pools[(tuple(shape), noise_amount)]
+        return pool[(rng or np.random).randint(len(pool))]
+
+
+def compile_block_swap(
+    effect: dict, shape: Tuple[int, ...]
+) -> Tuple[NumpyArray, NumpyArray]:
+    """ flat indices of the values changed by `apply_block_swap` with this effect config and
+    the flat indices of the values of the original frame they get """
+    size = int(np.prod(shape))
+    index = np.arange(size, dtype=np.int32).reshape(shape)
+    # swapping the indices of the values gives where each one comes from
+    src_map = apply_block_swap(index, np.full(shape, -1, np.int32), effect).ravel()
+    dst_idxs = np.flatnonzero(src_map >= 0).astype(np.int32)
+    return dst_idxs, src_map[dst_idxs]
+
+
+def apply_block_remap(
+    frame_orig: NumpyArray, frame: NumpyArray, remap: Tuple[NumpyArray, NumpyArray]
+) -> NumpyArray:
+    """ same as `apply_block_swap` with the indices of `compile_block_swap` """
+    dst_idxs, src_idxs = remap
+    frame = np.ascontiguousarray(frame)
+    frame.reshape(-1)[dst_idxs] = np.ascontiguousarray(frame_orig).reshape(-1)[src_idxs]
+    return frame
 
 
 def apply_progressive_channel_movement(
@@ -196,24 +612,40 @@ def apply_progressive_channel_movement(
     current_effect_frame: int,
 ) -> NumpyArray:
 
+    # long effects move the channels out of small frames, keep a row / column of them
+    max_dx, max_dy = frame.shape[0] - 1, frame.shape[1] - 1
     for c in range(3):
         dx, dy = channel_directions[c] * int(current_effect_frame * channels_movement)
+        dx, dy = int(np.clip(dx, -max_dx, max_dx)), int(np.clip(dy, -max_dy, max_dy))
         frame = move_channel(frame, c, dx, dy)
     return frame
 
 
 def apply_random_channel_movement(
-    frame: NumpyArray, channels_movement: float
+    frame: NumpyArray,
+    channels_movement: float,
+    rng: Optional[np.random.RandomState] = None,
 ) -> NumpyArray:
 
     delta = channels_movement * 15
-    frame = move_channels_random(frame, -delta, delta)
+    frame = move_channels_random(frame, -delta, delta, rng)
     return frame
 
 
-def apply_effect_config(width: int, height: int, block_count: int, block_size: float):
+def apply_effect_config(
+    width: int,
+    height: int,
+    block_count: int,
+    block_size: float,
+    rng: Optional[np.random.RandomState] = None,
+):
     return configure_effect(
-        width, height, min_blocks=1, max_blocks=block_count, block_size=block_size
+        width,
+        height,
+        min_blocks=1,
+        max_blocks=block_count,
+        block_size=block_size,
+        rng=rng,
     )
 
 
@@ -238,9 +670,12 @@ def apply_block_swap(
 
 
 def apply_salt_and_pepper(
-    frame: NumpyArray, noise_intensity: int, noise_amount: int
+    frame: NumpyArray,
+    noise_intensity: int,
+    noise_amount: int,
+    rng: Optional[np.random.RandomState] = None,
 ) -> NumpyArray:
-    frame = salt_and_pepper(frame, noise_intensity, 1 - noise_amount)
+    frame = salt_and_pepper(frame, noise_intensity, 1 - noise_amount, rng)
     return frame
 
 
@@ -250,19 +685,20 @@ def configure_effect(
     min_blocks: int = 1,
     max_blocks: int = 4,
     block_size: float = 0.5,
+    rng: Optional[np.random.RandomState] = None,
 ) -> dict:
-
+    rng = rng or np.random
     max_size = min(height, width) * block_size
-    num_blocks = np.random.randint(min_blocks, max_blocks)
+    num_blocks = rng.randint(min_blocks, max_blocks)
 
-    block_sizes = np.random.randint(0, max_size, (num_blocks, 2))
-    block_channels = np.random.randint(0, 3, (num_blocks,))
+    block_sizes = rng.randint(0, max_size, (num_blocks, 2))
+    block_channels = rng.randint(0, 3, (num_blocks,))
 
     block_xs, block_ys = [], []
 
     for b in range(num_blocks):
-        block_xs.append(np.random.randint(0, max(2, height - block_sizes[b][0]), (2,)))
-        block_ys.append(np.random.randint(0, max(2, width - block_sizes[b][1]), (2,)))
+        block_xs.append(rng.randint(0, max(2, height - block_sizes[b][0]), (2,)))
+        block_ys.append(rng.randint(0, max(2, width - block_sizes[b][1]), (2,)))
 
     return {
         "num_blocks": num_blocks,
@@ -0,0 +1,289 @@
+""" render the segments of a video in several workers and stitch them together """
+
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import os.path as osp
+import socket
+import threading
+import time
+import traceback
+
+from .segments import (
+    MIN_SEGMENT_FRAMES,
+    hash_file,
+    plan_segments,
+    render_segment,
+    segment_key,
+)
+from .video_utils import concat_videos, get_frame_times
+
+# distributed jobs are worth it for long videos, keep the segments big
+DISTRIBUTED_SEGMENT_FRAMES = MIN_SEGMENT_FRAMES * 10
+
+# seconds between the heartbeats of a worker, and without them before a claimed job is
+# considered lost with its worker and handed to another one
+HEARTBEAT_INTERVAL = 10.0
+CLAIM_TIMEOUT = 60.0
+
+
+class Transport(ABC):
+    """ how the coordinator hands jobs to the workers and gets the results back. Jobs and
+    results are json serializable dicts, jobs have an `id` """
+
+    @abstractmethod
+    def submit(self, job: dict) -> None:
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """ takes a pending job, so no other worker gets it. None if there are none """
+        pass
+
+    @abstractmethod
+    def heartbeat(self, job: dict) -> None:
+        """ tells the job is still being worked on """
+        pass
+
+    @abstractmethod
+    def requeue_stale(self, max_age: float) -> List[str]:
+        """ makes pending again the claimed jobs without a heartbeat in the last `max_age`
+        seconds. Returns their ids """
+        pass
+
+    @abstractmethod
+    def complete(self, job: dict, error: Optional[str] = None) -> None:
+        pass
+
+    @abstractmethod
+    def results(self, job_ids: List[str]) -> Dict[str, dict]:
+        """ results of the given jobs that are finished, by job id """
+        pass
+
+
+class FileSystemTransport(Transport):
+    """ transport through a directory shared by the coordinator and the workers (a local
+    directory for a single machine, or a network filesystem). Jobs are claimed by renaming
+    their file, which is atomic, and the modification time of the claimed file is the time
+    of the last heartbeat """
+
+    def __init__(self, root: str):
+        self.root = root
+        for state in ["pending", "claimed", "done"]:
+            os.makedirs(osp.join(root, state), exist_ok=True)
+
+    def _path(self, state: str, job_id: str) -> str:
+        return osp.join(self.root, state, f"{job_id}.json")
+
+    def _write(self, path: str, content: dict) -> None:
+        partial_path = f"{path}.partial"
+        with open(partial_path, "w") as f:
+            json.dump(content, f)
+        os.replace(partial_path, path)
+
+    def submit(self, job: dict) -> None:
+        # ids are the segment keys, drop the state of previous renders of the same segment
+        for state in ["done", "claimed"]:
+            try:
+                os.remove(self._path(state, job["id"]))
+            except FileNotFoundError:
+                pass
+        self._write(self._path("pending", job["id"]), job)
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        pending_dir = osp.join(self.root, "pending")
+        for filename in sorted(os.listdir(pending_dir)):
+            if not filename.endswith(".json"):
+                continue
+            claimed_path = osp.join(self.root, "claimed", filename)
+            try:
+                os.rename(osp.join(pending_dir, filename), claimed_path)
+            except FileNotFoundError:
+                continue  # another worker was faster
+            os.utime(claimed_path)
+            with open(claimed_path) as f:
+                job = json.load(f)
+            job["worker"] = worker_id
+            return job
+        return None
+
+    def heartbeat(self, job: dict) -> None:
+        try:
+            os.utime(self._path("claimed", job["id"]))
+        except FileNotFoundError:
+            pass  # requeued, the result is still valid if this worker finishes first
+
+    def requeue_stale(self, max_age: float) -> List[str]:
+        claimed_dir = osp.join(self.root, "claimed")
+        requeued = []
+        for filename in os.listdir(claimed_dir):
+            if not filename.endswith(".json"):
+                continue
+            claimed_path = osp.join(claimed_dir, filename)
+            try:
+                if time.time() - osp.getmtime(claimed_path) <= max_age:
+                    continue
+                os.rename(claimed_path, osp.join(self.root, "pending", filename))
+            except FileNotFoundError:
+                continue  # completed meanwhile
+            requeued.append(osp.splitext(filename)[0])
+        return requeued
+
+    def complete(self, job: dict, error: Optional[str] = None) -> None:
+        self._write(
+            self._path("done", job["id"]),
+            {"id": job["id"], "worker": job.get("worker"), "error": error},
+        )
+        try:
+            os.remove(self._path("claimed", job["id"]))
+        except FileNotFoundError:
+            pass  # requeued while it was rendered
+
+    def results(self, job_ids: List[str]) -> Dict[str, dict]:
+        results = {}
+        for job_id in job_ids:
+            path = self._path("done", job_id)
+            if osp.exists(path):
+                with open(path) as f:
+                    results[job_id] = json.load(f)
+        return results
+
+
+def render_distributed(
+    input_path: str,
+    output_path: str,
+    transport: Transport,
+    work_dir: str,
+    seed: int,
+    overrides: Optional[List[Tuple[int, int, dict]]] = None,
+    segment_frames: int = DISTRIBUTED_SEGMENT_FRAMES,
+    timeout: Optional[float] = None,
+    poll_interval: float = 1.0,
+    claim_timeout: float = CLAIM_TIMEOUT,
+    **params,
+) -> None:
+    """ glitches a video like `glitch_video`, sending a job per segment to the workers
+    through `transport`. `work_dir` and `input_path` must be reachable by the workers. The
+    effects of each frame only depend on the seed and its frame number, so the result is the
+    same as rendering in a single node with the same seed. Segments are stored in `work_dir`
+    with the keys of the segment cache, so segments of a previous render are not sent again.
+    Segments of workers without a heartbeat in `claim_timeout` seconds are sent again """
+    os.makedirs(work_dir, exist_ok=True)
+    input_path = osp.abspath(input_path)
+    input_hash = hash_file(input_path)
+    frame_times, keyframes = get_frame_times(input_path)
+    segments = plan_segments(frame_times, keyframes, segment_frames)
+
+    job_ids = []
+    for segment in segments:
+        key = segment_key(input_hash, segment, seed, params, overrides)
+        segment["path"] = osp.abspath(osp.join(work_dir, f"{key}.mp4"))
+        if osp.exists(segment["path"]):
+            continue
+        job = {
+            "id": key,
+            "input_path": input_path,
+            "output_path": segment["path"],
+            "segment": {
+                "start": segment["start"],
+                "end": segment["end"],
+                "start_time": segment["start_time"],
+            },
+            "seed": seed,
+            "overrides": overrides,
+            "params": params,
+        }
+        transport.submit(job)
+        job_ids.append(key)
+    print(f"submitted {len(job_ids)} of {len(segments)} segments")
+
+    started = time.time()
+    pending = set(job_ids)
+    while pending:
+        for job_id, result in transport.results(list(pending)).items():
+            if result["error"]:
+                raise RuntimeError(
+                    f"segment {job_id} failed in worker {result['worker']}:\n"
+                    f"{result['error']}"
+                )
+            pending.remove(job_id)
+        for job_id in transport.requeue_stale(claim_timeout):
+            print(f"segment {job_id} lost its worker, sent again")
+        if timeout is not None and time.time() - started > timeout:
+            raise TimeoutError(f"{len(pending)} segments not finished")
+        if pending:
+            time.sleep(poll_interval)
+
+    concat_videos([segment["path"] for segment in segments], output_path)
+
+
+def run_worker(
+    transport: Transport,
+    worker_id: Optional[str] = None,
+    poll_interval: float = 1.0,
+    max_jobs: Optional[int] = None,
+    exit_when_idle: bool = False,
+    heartbeat_interval: float = HEARTBEAT_INTERVAL,
+) -> int:
+    """ renders the segments sent by `render_distributed` until `max_jobs` are done or, if
+    `exit_when_idle`, there are no more pending jobs. Returns the number of jobs done """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job = transport.claim(worker_id)
+        if job is None:
+            if exit_when_idle:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"{worker_id}: rendering segment {job['id']}")
+        rendering = threading.Event()
+        heartbeats = threading.Thread(
+            target=_send_heartbeats,
+            args=(transport, job, rendering, heartbeat_interval),
+            daemon=True,
+        )
+        heartbeats.start()
+        try:
+            render_segment(
+                job["input_path"],
+                job["output_path"],
+                job["segment"],
+                job["seed"],
+                [tuple(override) for override in job["overrides"] or []],
+                **job["params"],
+            )
+        except Exception:
+            error = traceback.format_exc()
+        else:
+            error = None
+        finally:
+            rendering.set()
+            heartbeats.join()
+        transport.complete(job, error=error)
+        done += 1
+    return done
+
+
+def _send_heartbeats(
+    transport: Transport, job: dict, done: threading.Event, interval: float
+) -> None:
+    while not done.wait(interval):
+        transport.heartbeat(job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="glitch segment rendering worker")
+    parser.add_argument("root", help="directory shared with the coordinator")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--exit-when-idle", action="store_true")
+    args = parser.parse_args()
+
+    run_worker(
+        FileSystemTransport(args.root),
+        worker_id=args.worker_id,
+        exit_when_idle=args.exit_when_idle,
+    )
@@ -0,0 +1,151 @@
+""" cache of decoded video frames in memory mapped raw files """
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import os
+import os.path as osp
+import tempfile
+
+import numpy as np
+
+from .video_utils import decode_frames, get_video_info
+
+NumpyArray = np.ndarray  # for typing
+
+FRAMES_FILENAME = "frames.rgb24"
+META_FILENAME = "frames.json"
+
+
+class FrameCache:
+    """ Stores the decoded frames of a video as a raw (N, H, W, 3) uint8 file in a directory
+    of the video inside `root`, so later renders of the same video read the frames from a
+    memory map instead of decoding it again. `root` should not be served, the frames are
+    big. When the cached frames of all the videos take more than `max_bytes` the least
+    recently used ones are removed """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _video_dir(self, video_path: str) -> str:
+        """ the directory of a video, a changed file gets a different one """
+        stat = os.stat(video_path)
+        key = f"{osp.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return osp.join(self.root, hashlib.sha1(key.encode()).hexdigest())
+
+    def _paths(self, video_dir: str) -> Tuple[str, str]:
+        return osp.join(video_dir, FRAMES_FILENAME), osp.join(video_dir, META_FILENAME)
+
+    def get(self, video_path: str) -> Optional[NumpyArray]:
+        """ read only memory map of the cached frames of the video, None if not cached """
+        frames_path, meta_path = self._paths(self._video_dir(video_path))
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        try:
+            os.utime(meta_path)  # mark as recently used
+            return np.memmap(
+                frames_path,
+                dtype=np.uint8,
+                mode="r",
+                shape=(meta["count"], meta["height"], meta["width"], 3),
+            )
+        except FileNotFoundError:
+            return None  # evicted after reading the metadata
+
+    def frames(
+        self,
+        video_path: str,
+        width: int,
+        height: int,
+        num_frames: Optional[int] = None,
+    ) -> Iterator[NumpyArray]:
+        """ frames of the video, from the cache if possible. Otherwise the video is decoded
+        and the frames are cached while they are yielded, unless the `num_frames` of the
+        video (probed if not given) do not fit in the cache """
+        cached = self.get(video_path)
+        if cached is not None:
+            return iter(cached)
+
+        frames = decode_frames(video_path, width, height)
+        if num_frames is None:
+            num_frames = get_video_info(video_path)["num_frames"]
+        if num_frames * height * width * 3 > self.max_bytes:
+            return frames
+        return self.store(video_path, frames)
+
+    def store(
+        self, video_path: str, frames: Iterable[NumpyArray]
+    ) -> Iterator[NumpyArray]:
+        """ yields the frames while writing them to the cache of the video. Nothing is
+        cached if the frames are not consumed till the end or they do not fit """
+        video_dir = self._video_dir(video_path)
+        os.makedirs(video_dir, exist_ok=True)
+        frames_path, meta_path = self._paths(video_dir)
+        fd, partial_path = tempfile.mkstemp(dir=video_dir, suffix=".partial")
+
+        count, size, shape = 0, 0, None
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for frame in frames:
+                    size += frame.nbytes
+                    # when they do not fit stop caching, but keep yielding the frames
+                    if size <= self.max_bytes:
+                        f.write(np.ascontiguousarray(frame, np.uint8).tobytes())
+                    count += 1
+                    shape = frame.shape
+                    yield frame
+            complete = 0 < size <= self.max_bytes
+        finally:
+            if complete:
+                self.evict(self.max_bytes - size, keep=video_dir)
+                os.replace(partial_path, frames_path)
+                # the metadata marks the frames as cached, it is never read half written
+                fd, partial_meta_path = tempfile.mkstemp(
+                    dir=video_dir, suffix=".partial"
+                )
+                with os.fdopen(fd, "w") as f:
+                    json.dump(
+                        {"count": count, "height": shape[0], "width": shape[1]}, f
+                    )
+                os.replace(partial_meta_path, meta_path)
+            else:
+                os.remove(partial_path)
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        """ (last use, size, directory) of the cached videos """
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            frames_path, meta_path = self._paths(entry.path)
+            try:
+                entries.append(
+                    (osp.getmtime(meta_path), osp.getsize(frames_path), entry.path)
+                )
+            except FileNotFoundError:
+                continue  # not cached, or evicted meanwhile
+        return entries
+
+    def evict(self, max_bytes: int, keep: Optional[str] = None) -> None:
+        """ removes the least recently used cached frames until they take `max_bytes` """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, video_dir in entries:
+            if total <= max_bytes:
+                break
+            if video_dir == keep:
+                continue
+            frames_path, meta_path = self._paths(video_dir)
+            try:
+                os.remove(meta_path)  # first, so the frames are never read without it
+                os.remove(frames_path)
+            except FileNotFoundError:
+                pass  # evicted by another render
+            total -= size
@@ -0,0 +1,157 @@
+""" index of the uploaded files and their glitches """
+
+from contextlib import closing, contextmanager
+from random import sample
+from typing import Iterator, List, Optional
+import os
+import os.path as osp
+import re
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    file_type TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (file_type, file_hash)
+);
+CREATE TABLE IF NOT EXISTS glitches (
+    id INTEGER PRIMARY KEY,
+    file_type TEXT NOT NULL,
+    -- 0, 1, 2... without gaps for each file type, to sample them uniformly. NULL while the
+    -- glitch is rendered, the row only reserves its number
+    seq INTEGER,
+    file_hash TEXT NOT NULL,
+    glitch_num INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    UNIQUE (file_type, file_hash, glitch_num)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS glitches_by_type ON glitches (file_type, seq);
+"""
+
+# glitch files are postfixed with _glitch_XX.ext
+GLITCH_FILENAME = re.compile(r"^(?P<file_hash>[0-9a-f]+)_glitch_(?P<num>\d+)\.\w+$")
+
+
+class GalleryIndex:
+    """ sqlite index of the files in the static folder, so the pages do not need to walk it.
+    Paths are stored as they are served, relative to the app """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection each time, requests may be served from different threads
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            with conn:
+                yield conn
+
+    def add_upload(self, file_type: str, file_hash: str, path: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?)",
+                (file_type, file_hash, path),
+            )
+
+    def upload_path(self, file_type: str, file_hash: str) -> Optional[str]:
+        """ path of the original file, None if it is not indexed """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT path FROM uploads WHERE file_type = ? AND file_hash = ?",
+                (file_type, file_hash),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def add_glitch(
+        self, file_type: str, file_hash: str, glitch_num: int, path: str
+    ) -> None:
+        with self._connect() as conn:
+            # a single statement, so concurrent requests do not get the same seq. A replaced
+            # glitch keeps its seq, so there are no gaps
+            conn.execute(
+                "INSERT OR REPLACE INTO glitches"
+                " (file_type, seq, file_hash, glitch_num, path) VALUES (?1, COALESCE("
+                "(SELECT seq FROM glitches"
+                " WHERE file_type = ?1 AND file_hash = ?2 AND glitch_num = ?3),"
+                " (SELECT COUNT(seq) FROM glitches WHERE file_type = ?1)), ?2, ?3, ?4)",
+                (file_type, file_hash, glitch_num, path),
+            )
+
+    def reserve_glitch_num(self, file_type: str, file_hash: str) -> int:
+        """ number of a new glitch of the file. It is reserved until `add_glitch` is called
+        with it, so concurrent renders of the same file get different numbers """
+        with self._connect() as conn:
+            glitch_id = conn.execute(
+                "INSERT INTO glitches (file_type, file_hash, glitch_num, path)"
+                " VALUES (?1, ?2, (SELECT COALESCE(MAX(glitch_num) + 1, 0) FROM glitches"
+                " WHERE file_type = ?1 AND file_hash = ?2), '')",
+                (file_type, file_hash),
+            ).lastrowid
+            (glitch_num,) = conn.execute(
+                "SELECT glitch_num FROM glitches WHERE id = ?", (glitch_id,)
+            ).fetchone()
+        return glitch_num
+
+    def history(self, file_type: str, file_hash: str) -> List[str]:
+        """ paths of the glitches of a file, oldest first """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT path FROM glitches WHERE file_type = ? AND file_hash = ?"
+                " AND seq IS NOT NULL ORDER BY glitch_num",
+                (file_type, file_hash),
+            ).fetchall()
+        return [path for (path,) in rows]
+
+    def sample(self, file_type: str, count: int) -> List[str]:
+        """ paths of up to `count` random glitches. Random seqs are looked up in the index
+        instead of scanning the whole table """
+        with self._connect() as conn:
+            (num_glitches,) = conn.execute(
+                "SELECT COUNT(seq) FROM glitches WHERE file_type = ?", (file_type,)
+            ).fetchone()
+            return [
+                conn.execute(
+                    "SELECT path FROM glitches WHERE file_type = ? AND seq = ?",
+                    (file_type, seq),
+                ).fetchone()[0]
+                for seq in sample(range(num_glitches), min(count, num_glitches))
+            ]
+
+    def rebuild(self, static_folder: str, file_types: List[str]) -> None:
+        """ indexes again the existing files in `static_folder`/<file_type>/<hash>/ """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM uploads")
+            conn.execute("DELETE FROM glitches")
+            for file_type in file_types:
+                seq = 0
+                type_folder = osp.join(static_folder, file_type)
+                if not osp.isdir(type_folder):
+                    continue
+                for file_hash in sorted(os.listdir(type_folder)):
+                    hash_folder = osp.join(type_folder, file_hash)
+                    if not osp.isdir(hash_folder):
+                        continue
+                    glitches = []
+                    for filename in os.listdir(hash_folder):
+                        path = osp.join(hash_folder, filename)
+                        if filename.startswith("original."):
+                            conn.execute(
+                                "INSERT OR REPLACE INTO uploads VALUES (?, ?, ?)",
+                                (file_type, file_hash, path),
+                            )
+                        match = GLITCH_FILENAME.match(filename)
+                        if match:
+                            glitches.append((int(match.group("num")), path))
+                    conn.executemany(
+                        "INSERT INTO glitches"
+                        " (file_type, seq, file_hash, glitch_num, path)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (file_type, seq + i, file_hash, num, path)
+                            for i, (num, path) in enumerate(sorted(glitches))
+                        ],
+                    )
+                    seq += len(glitches)
@@ -1,12 +1,15 @@
-""" Image glitchig functions """
+""" Image glitchig functions. The random ones draw from their `rng`, a
+`np.random.RandomState`, or from the global random state if it is None """
 
+from functools import lru_cache
 from typing import Optional, Tuple
-from skimage.transform import resize
 
 import numpy as np
 
 NumpyArray = np.ndarray  # for typing
 
+INTERPOLATIONS = ["nearest", "bilinear"]
+
 
 def move_channel(arr: NumpyArray, channel: int, deltax: int, deltay: int) -> NumpyArray:
     """ move the given channel in the direction (deltax, deltay) """
@@ -28,12 +31,16 @@ def move_channel(arr: NumpyArray, channel: int, deltax: int, deltay: int) -> Num
 
 
 def move_channels_random(
-    arr: NumpyArray, min_delta: int = -50, max_delta: int = 50
+    arr: NumpyArray,
+    min_delta: int = -50,
+    max_delta: int = 50,
+    rng: Optional[np.random.RandomState] = None,
 ) -> NumpyArray:
     """ move each channel a random amount between -val and val"""
+    rng = rng or np.random
     res = arr.copy()
     for channel in range(arr.shape[-1]):
-        deltax, deltay = np.random.randint(min_delta, max_delta, (2,))
+        deltax, deltay = rng.randint(min_delta, max_delta, (2,))
         res = move_channel(res, channel, deltax, deltay)
     return res
 
@@ -80,46 +87,123 @@ def swap_block_arbitrary_size(
     origin_block: Tuple[int, int, int, int],
     dst_block: Tuple[int, int, int, int],
     channel: Optional[int] = None,
+    interpolation: str = "nearest",
 ) -> NumpyArray:
     """ Swap a block in the images. blocks are defined by tlx, tly, width, height. If different
-    size blocks, resize """
+    size blocks, each one is scaled to the size of the other with `scale_block` """
     channel = channel or ...
     tl_x_origin, tl_y_origin, width_origin, height_origin = origin_block
-    block_1 = origin_arr[
-        tl_x_origin : tl_x_origin + width_origin,
-        tl_y_origin : tl_y_origin + height_origin,
+    origin_idx = (
+        slice(tl_x_origin, tl_x_origin + width_origin),
+        slice(tl_y_origin, tl_y_origin + height_origin),
         channel,
-    ]
+    )
 
     tl_x_dst, tl_y_dst, width_dst, height_dst = dst_block
-    block_2 = origin_arr[
-        tl_x_dst : tl_x_dst + width_dst, tl_y_dst : tl_y_dst + height_dst, channel,
-    ]
+    dst_idx = (
+        slice(tl_x_dst, tl_x_dst + width_dst),
+        slice(tl_y_dst, tl_y_dst + height_dst),
+        channel,
+    )
 
-    if block_1.shape != block_2.shape:
-        # resize both blocks
-        block_1 = resize(block_1, (width_dst, height_dst), preserve_range=True)
-        block_2 = resize(block_2, (width_origin, height_origin), preserve_range=True)
+    block_1 = origin_arr[origin_idx]
+    block_2 = origin_arr[dst_idx]
+    if np.may_share_memory(origin_arr, dst_arr):
+        # both blocks are views, writing block_1 would overwrite block_2 before it is read
+        block_1 = block_1.copy()
+        block_2 = block_2.copy()
 
-    dst_arr[
-        tl_x_dst : tl_x_dst + width_dst, tl_y_dst : tl_y_dst + height_dst, channel,
-    ] = block_1
-    dst_arr[
-        tl_x_origin : tl_x_origin + width_origin,
-        tl_y_origin : tl_y_origin + height_origin,
-        channel,
-    ] = block_2
+    # blocks near the border can be clipped, scale to the actual size of the target
+    dst_arr[dst_idx] = scale_block(block_1, dst_arr[dst_idx].shape[:2], interpolation)
+    dst_arr[origin_idx] = scale_block(
+        block_2, dst_arr[origin_idx].shape[:2], interpolation
+    )
 
     return dst_arr
 
 
+def scale_block(
+    block: NumpyArray, size: Tuple[int, int], interpolation: str = "nearest"
+) -> NumpyArray:
+    """ scale the first two dimensions of `block` to `size`, keeping its dtype.
+    `interpolation` is one of `INTERPOLATIONS`. Returns the block itself if it already has
+    the requested size """
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(f"interpolation must be one of {INTERPOLATIONS}")
+
+    src_size = tuple(block.shape[:2])
+    size = tuple(int(x) for x in size)
+    if src_size == size:
+        return block
+    if 0 in src_size or 0 in size:
+        return np.zeros(size + block.shape[2:], block.dtype)
+
+    if interpolation == "nearest":
+        rows, cols = _nearest_indices(src_size, size)
+        return block.take(rows, axis=0).take(cols, axis=1)
+
+    return _scale_bilinear(block, size)
+
+
+@lru_cache(maxsize=256)
+def _nearest_indices(
+    src_size: Tuple[int, int], dst_size: Tuple[int, int]
+) -> Tuple[NumpyArray, NumpyArray]:
+    """ integer index vectors mapping each dst row / col to the nearest src row / col """
+    indices = []
+    for src_len, dst_len in zip(src_size, dst_size):
+        idx = (np.arange(dst_len) * 2 + 1) * src_len // (2 * dst_len)
+        idx.setflags(write=False)  # shared through the cache
+        indices.append(idx)
+    return tuple(indices)
+
+
+@lru_cache(maxsize=256)
+def _bilinear_weights(
+    src_size: Tuple[int, int], dst_size: Tuple[int, int]
+) -> Tuple[Tuple[NumpyArray, NumpyArray, NumpyArray], ...]:
+    """ for each axis, the two src indices surrounding each dst position and the weight of the
+    second one in 1/256 units """
+    weights = []
+    for src_len, dst_len in zip(src_size, dst_size):
+        pos = (np.arange(dst_len) + 0.5) * src_len / dst_len - 0.5
+        pos = np.clip(pos, 0, src_len - 1)
+        idx_0 = np.floor(pos).astype(np.intp)
+        idx_1 = np.minimum(idx_0 + 1, src_len - 1)
+        weight = np.round((pos - idx_0) * 256).astype(np.uint16)
+        for arr in (idx_0, idx_1, weight):
+            arr.setflags(write=False)
+        weights.append((idx_0, idx_1, weight))
+    return tuple(weights)
+
+
+def _scale_bilinear(block: NumpyArray, size: Tuple[int, int]) -> NumpyArray:
+    """ bilinear scaling. uint8 blocks are interpolated in fixed point uint16, the largest
+    intermediate value is 255 * 256 + 128 so it never overflows """
+    fixed_point = block.dtype == np.uint8
+    res = block.astype(np.uint16 if fixed_point else np.float32)
+    axes_weights = _bilinear_weights(block.shape[:2], size)
+    for axis, (idx_0, idx_1, weight) in enumerate(axes_weights):
+        shape = [1] * block.ndim
+        shape[axis] = -1
+        weight = weight.reshape(shape)
+        low, high = res.take(idx_0, axis=axis), res.take(idx_1, axis=axis)
+        if fixed_point:
+            res = (low * (256 - weight) + high * weight + 128) >> 8
+        else:
+            res = (low * (256 - weight) + high * weight) / 256
+    return res.astype(block.dtype)
+
+
 def move_random_blocks(
     arr: NumpyArray,
     max_blocksize: Tuple[int, int] = (5, 5),
     num_blocks: int = 5,
     per_channel: bool = False,
+    rng: Optional[np.random.RandomState] = None,
 ) -> NumpyArray:
     """ swap `num_blocks` of size `blocksize` in arr """
+    rng = rng or np.random
     res = arr.copy()
     w, h, n_channels = arr.shape
 
@@ -130,17 +214,17 @@ def move_random_blocks(
     max_block_size_y = min(h, max_block_size_y)
 
     for _ in range(num_blocks):
-        block_size_x = np.random.randint(1, max_block_size_x)
-        block_size_y = np.random.randint(1, max_block_size_y)
+        block_size_x = rng.randint(1, max_block_size_x)
+        block_size_y = rng.randint(1, max_block_size_y)
 
-        block_origin_x = np.random.randint(0, w - block_size_x)
-        block_origin_y = np.random.randint(0, h - block_size_y)
+        block_origin_x = rng.randint(0, w - block_size_x)
+        block_origin_y = rng.randint(0, h - block_size_y)
 
-        block_dest_x = np.random.randint(0, w - block_size_x)
-        block_dest_y = np.random.randint(0, h - block_size_y)
+        block_dest_x = rng.randint(0, w - block_size_x)
+        block_dest_y = rng.randint(0, h - block_size_y)
 
         if per_channel:
-            channel = np.random.randint(0, n_channels)
+            channel = rng.randint(0, n_channels)
         else:
             channel = None
 
@@ -163,8 +247,10 @@ def scanlines(
     intensity: float = 0.5,
     band_size: int = 5,
     band_spacing: float = 2.0,
+    rng: Optional[np.random.RandomState] = None,
 ) -> NumpyArray:
     """ darken horizontal sections of image with parameterized height and spacing """
+    rng = rng or np.random
     res = arr.copy()
     h, w, n_channels = arr.shape
 
@@ -173,7 +259,7 @@ def scanlines(
     band_count = int(h / space_between_bands)
 
     for i in range(band_count):
-        band_start_y = space_between_bands * i + np.random.randint(0, 2)
+        band_start_y = space_between_bands * i + rng.randint(0, 2)
 
         band_end_y = band_start_y + band_size
 
@@ -186,43 +272,31 @@ def scanlines(
             intensity_factor * arr[band_start_y:band_end_y, 0:w, ...,]
         )
 
-        channel = channel or ...
-
-        if noisy:
-            res[band_start_y:band_end_y, band_start_x:band_end_x, ...,] = np.multiply(
-                arr[band_start_y:band_end_y, band_start_x:band_end_x, ...,],
-                np.random.randint(
-                    0, 256, (band_size_y, band_size_x, n_channels), np.uint8
-                ),
-            )
-        else:
-            intensity_factor = 1 - ((band_start_y % 10) / 40 * intensity)
-            res[band_start_y:band_end_y, band_start_x:band_end_x, ...,] = (
-                intensity_factor
-                * arr[band_start_y:band_end_y, band_start_x:band_end_x, ...,]
-            )
-
-    res = res * (1 - np.random.random() / 5)
+    res = res * (1 - rng.random_sample() / 5)
 
     return res
 
 
 def flip_block(
-    arr: NumpyArray, blocksize: Tuple[int, int], per_channel: bool
+    arr: NumpyArray,
+    blocksize: Tuple[int, int],
+    per_channel: bool,
+    rng: Optional[np.random.RandomState] = None,
 ) -> NumpyArray:
     """ Flips vertically and horizontally the content of a random block of `blocksize` size.
   if `per_channel` a random block is flipped in each channel """
+    rng = rng or np.random
     res = arr.copy()
     w, h, n_channels = arr.shape
     block_size_x, block_size_y = blocksize
 
-    block_x = np.random.randint(0, w - block_size_x)
-    block_y = np.random.randint(0, h - block_size_y)
+    block_x = rng.randint(0, w - block_size_x)
+    block_y = rng.randint(0, h - block_size_y)
 
     if per_channel:
         # each channel have 50% prob of flipping
         for c in range(n_channels):
-            if np.random.randint(0, 1):
+            if rng.randint(0, 1):
                 flipped_block = arr[
                     block_x : block_x + block_size_x,
                     block_y : block_y + block_size_y,
@@ -246,36 +320,58 @@ def flip_block(
 
 
 def salt_and_pepper(
-    arr: NumpyArray, intensity: float = 1.0, noise_frac: float = 0.02
+    arr: NumpyArray,
+    intensity: float = 1.0,
+    noise_frac: float = 0.02,
+    rng: Optional[np.random.RandomState] = None,
 ) -> NumpyArray:
     """ replaces random pixels with 255,255,255 or 0,0,0
     noise fraction is the fracion of pixels with noise applied"""
-    if not 0 <= intensity <= 1.0:
-        raise ValueError("intensity must be between 0 and 1.0!")
+    w, h, c = arr.shape
+    noise_idxs, noise_values = noise_mask((w, h), noise_frac, rng)
+    return apply_noise_mask(arr, noise_idxs, noise_values, intensity)
+
+
+def noise_mask(
+    shape: Tuple[int, int],
+    noise_frac: float = 0.02,
+    rng: Optional[np.random.RandomState] = None,
+) -> Tuple[NumpyArray, NumpyArray]:
+    """ random salt and pepper noise for an image of the given shape: the flat indices of
+    the pixels replaced with noise and their values, 255 or 0 """
     if not 0 <= noise_frac <= 1.0:
         raise ValueError("noise_frac must be between 0 and 1.0!")
-    w, h, c = arr.shape
+    rng = rng or np.random
 
-    noise_mask = np.random.random((w, h))
-    noise_mask[noise_mask < noise_frac] = 0
-    noise_mask[noise_mask >= noise_frac] = 1
+    noise_mask = rng.random_sample(shape) >= noise_frac
+    noise_rgb = rng.randint(0, 256, shape, np.uint8)
 
     # idx of the pixels that will be replaced with noise
-    noise_idxs = np.where(noise_mask == 1)
+    noise_idxs = np.flatnonzero(noise_mask).astype(np.int32)
+    noise_values = np.where(noise_rgb.ravel()[noise_idxs] > 128, 255, 0).astype(np.uint8)
+    return noise_idxs, noise_values
 
-    noise_rgb = np.random.randint(0, 256, (w, h), np.uint8)
-    noise_rgb[noise_rgb > 128] = 255
-    noise_rgb[noise_rgb <= 128] = 0
-    noise_rgb = np.dstack([noise_rgb,] * c)  # make it accually rgb(a)
-    if c == 4:
-        # keep original alpha
-        noise_rgb[..., -1] = arr[..., -1]
+
+def apply_noise_mask(
+    arr: NumpyArray,
+    noise_idxs: NumpyArray,
+    noise_values: NumpyArray,
+    intensity: float = 1.0,
+) -> NumpyArray:
+    """ applies noise of `noise_mask` to a copy of arr, blending it with `intensity` """
+    if not 0 <= intensity <= 1.0:
+        raise ValueError("intensity must be between 0 and 1.0!")
+    w, h, c = arr.shape
 
     arr = arr.copy()
+    pixels = arr.reshape(w * h, c)
+    # keep original alpha
+    channels = slice(0, 3) if c == 4 else slice(None)
+    noise_values = noise_values[:, None]
     if intensity == 1.0:
-        arr[noise_idxs] = noise_rgb[noise_idxs]
+        pixels[noise_idxs, channels] = noise_values
     else:
-        arr[noise_idxs] = noise_rgb[noise_idxs] * intensity + arr[noise_idxs] * (
-            1 - intensity
-        )
+        pixels[noise_idxs, channels] = noise_values * intensity + pixels[
+            noise_idxs, channels
+        ] * (1 - intensity)
     return arr
@@ -0,0 +1,90 @@
+""" binary recipes of renders, to replay them """
+
+from functools import lru_cache
+from typing import List, Tuple
+import glob
+import hashlib
+import json
+import os.path as osp
+import struct
+
+import numpy as np
+
+NumpyArray = np.ndarray  # for typing
+
+RECIPE_EXTENSION = ".recipe"
+
+# magic, format version and length of the json metadata
+MAGIC = b"GLRC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHI")
+
+# an effect of `effect_schedule` per record
+EFFECT_DTYPE = np.dtype(
+    [
+        ("start", "<u4"),
+        ("length", "<u4"),
+        ("roll", "u1"),
+        ("roll_noise", "u1"),
+        ("channel_directions", "i1", (3, 2)),
+    ]
+)
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """ hash of the source of the package. `__version__` is only changed on releases, this
+    changes with any change of the code, which may change the output of the same recipe """
+    sha = hashlib.sha1()
+    for path in sorted(glob.glob(osp.join(osp.dirname(__file__), "*.py"))):
+        with open(path, "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:12]
+
+
+def timeline_to_array(timeline: List[dict]) -> NumpyArray:
+    arr = np.zeros(len(timeline), EFFECT_DTYPE)
+    for i, effect in enumerate(timeline):
+        for field in EFFECT_DTYPE.names:
+            arr[field][i] = effect[field]
+    return arr
+
+
+def array_to_timeline(arr: NumpyArray) -> List[dict]:
+    return [
+        {
+            "start": int(record["start"]),
+            "length": int(record["length"]),
+            "roll": int(record["roll"]),
+            "roll_noise": int(record["roll_noise"]),
+            "channel_directions": record["channel_directions"].astype(int),
+        }
+        for record in arr
+    ]
+
+
+def save_recipe(path: str, metadata: dict, timeline: List[dict]) -> None:
+    """ writes the metadata of a render (seed, params, code version...) as json and the
+    effects of every frame as an array of `EFFECT_DTYPE` records """
+    metadata_bytes = json.dumps(metadata, sort_keys=True).encode()
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(metadata_bytes)))
+        f.write(metadata_bytes)
+        f.write(timeline_to_array(timeline).tobytes())
+
+
+def load_recipe(path: str) -> Tuple[dict, List[dict]]:
+    """ metadata and timeline of a recipe written by `save_recipe` """
+    with open(path, "rb") as f:
+        content = f.read()
+
+    magic, version, metadata_length = HEADER.unpack_from(content)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a recipe")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"unsupported recipe format version {version}")
+
+    metadata_end = HEADER.size + metadata_length
+    metadata = json.loads(content[HEADER.size : metadata_end].decode())
+    timeline = array_to_timeline(np.frombuffer(content[metadata_end:], EFFECT_DTYPE))
+    return metadata, timeline
@@ -0,0 +1,149 @@
+""" render videos by segments starting at keyframes, caching the rendered segments """
+
+from typing import List, Optional, Tuple
+import hashlib
+import json
+import os
+import os.path as osp
+import uuid
+
+import numpy as np
+
+from .apps import VIDEO_DEFAULTS, glitch_frames
+from .recipe import code_version
+from .video_utils import (
+    FrameWriter,
+    concat_videos,
+    decode_frames,
+    get_frame_times,
+    get_video_size,
+)
+
+NumpyArray = np.ndarray  # for typing
+
+MIN_SEGMENT_FRAMES = 50
+
+
+def hash_file(filename: str) -> str:
+    hasher = hashlib.md5()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def plan_segments(
+    frame_times: NumpyArray,
+    keyframes: NumpyArray,
+    min_segment_frames: int = MIN_SEGMENT_FRAMES,
+) -> List[dict]:
+    """ splits the frames at keyframes in segments of at least `min_segment_frames` frames
+    (except the last one). Each segment is a dict with the `start` and `end` frames (end not
+    included) and the `start_time` to seek to, None for the first segment """
+    starts = [0]
+    for frame_idx in np.flatnonzero(keyframes):
+        if frame_idx - starts[-1] >= min_segment_frames:
+            starts.append(int(frame_idx))
+    ends = starts[1:] + [len(frame_times)]
+
+    segments = []
+    for start, end in zip(starts, ends):
+        # seek between the previous frame and the keyframe so rounding can not skip it
+        start_time = (
+            None if start == 0 else (frame_times[start - 1] + frame_times[start]) / 2
+        )
+        segments.append({"start": start, "end": end, "start_time": start_time})
+    return segments
+
+
+def segment_key(
+    input_hash: str,
+    segment: dict,
+    seed: int,
+    params: dict,
+    overrides: Optional[List[Tuple[int, int, dict]]] = None,
+) -> str:
+    """ cache key of a rendered segment: the input, the frame range, the version of the code
+    and everything that decides the effects of those frames """
+    start, end = segment["start"], segment["end"]
+    descriptor = {
+        "input": input_hash,
+        "code_version": code_version(),
+        "start": start,
+        "end": end,
+        "seed": seed,
+        "params": {**VIDEO_DEFAULTS, **params},
+        # only the part of the overrides inside the segment changes it
+        "overrides": [
+            [max(start, o_start), min(end, o_end), override]
+            for o_start, o_end, override in overrides or []
+            if o_start < end and o_end > start
+        ],
+    }
+    return hashlib.sha1(json.dumps(descriptor, sort_keys=True).encode()).hexdigest()
+
+
+def render_segment(
+    input_path: str,
+    output_path: str,
+    segment: dict,
+    seed: int,
+    overrides: Optional[List[Tuple[int, int, dict]]] = None,
+    **params,
+) -> None:
+    """ renders the frames of the segment to output_path. The output only appears once it
+    is complete, so an interrupted render never ends in the cache """
+    width, height = get_video_size(input_path)
+    root, extension = osp.splitext(output_path)
+    # unique, a segment requeued from a slow worker may be rendered twice at the same time
+    partial_path = f"{root}.{uuid.uuid4().hex}.partial{extension}"
+
+    frames = glitch_frames(
+        decode_frames(
+            input_path,
+            width,
+            height,
+            start_time=segment["start_time"],
+            num_frames=segment["end"] - segment["start"],
+        ),
+        seed,
+        start_frame=segment["start"],
+        overrides=overrides,
+        **params,
+    )
+    with FrameWriter(partial_path, width, height) as writer:
+        for frame in frames:
+            writer.write(frame)
+    os.replace(partial_path, output_path)
+
+
+def glitch_video_segments(
+    input_path: str,
+    output_path: str,
+    cache_dir: str,
+    seed: int,
+    overrides: Optional[List[Tuple[int, int, dict]]] = None,
+    min_segment_frames: int = MIN_SEGMENT_FRAMES,
+    **params,
+) -> List[dict]:
+    """ glitches a video like `glitch_video`, rendering it by segments. Segments already in
+    `cache_dir` are reused. `overrides` is a list of (start, end, params) changing the params
+    of the frames [start, end), see `glitch_frames`. Returns the segments, with the `path`
+    of the rendered file and whether it was `cached` """
+    os.makedirs(cache_dir, exist_ok=True)
+    input_hash = hash_file(input_path)
+    frame_times, keyframes = get_frame_times(input_path)
+
+    segments = plan_segments(frame_times, keyframes, min_segment_frames)
+    for segment in segments:
+        key = segment_key(input_hash, segment, seed, params, overrides)
+        segment["path"] = osp.join(cache_dir, f"{key}.mp4")
+        segment["cached"] = osp.exists(segment["path"])
+        if not segment["cached"]:
+            print(f"rendering frames {segment['start']}-{segment['end']}")
+            render_segment(
+                input_path, segment["path"], segment, seed, overrides, **params
+            )
+
+    concat_videos([segment["path"] for segment in segments], output_path)
+    return segments
@@ -1,34 +1,70 @@
 """ reading and writing video tools """
 
-from typing import Tuple, Optional
+from collections import deque
+from typing import Iterator, List, Tuple, Optional
+import os
+import queue
 import subprocess
+import tempfile
+import threading
 import numpy as np
 import ffmpeg
 
 NumpyArray = np.ndarray  # for typing
 
+# frames buffered between the decoder / encoder threads and the glitching
+FRAME_QUEUE_SIZE = 16
+STDERR_TAIL_LINES = 20
 
-def start_ffmpeg_writer(out_filename: str, width: int, height: int) -> subprocess.Popen:
-    """ Starts video writer process """
+_END_OF_STREAM = object()
+
+
+def start_ffmpeg_writer(
+    out_filename: str,
+    width: int,
+    height: int,
+    stderr: Optional[int] = None,
+    fps: Optional[float] = None,
+) -> subprocess.Popen:
+    """ Starts video writer process. The frames are written at `fps`, 25 if not given """
+    input_kwargs = {} if fps is None else {"framerate": fps}
     args = (
         ffmpeg.input(
-            "pipe:", format="rawvideo", pix_fmt="rgb24", s="{}x{}".format(width, height)
+            "pipe:",
+            format="rawvideo",
+            pix_fmt="rgb24",
+            s="{}x{}".format(width, height),
+            **input_kwargs,
         )
         .output(out_filename, pix_fmt="yuv420p")
         .overwrite_output()
         .compile()
     )
-    return subprocess.Popen(args, stdin=subprocess.PIPE)
+    return subprocess.Popen(args, stdin=subprocess.PIPE, stderr=stderr)
 
 
-def start_ffmpeg_reader(in_filename: str) -> subprocess.Popen:
-    """ Starts video reader process """
-    args = (
-        ffmpeg.input(in_filename)
-        .output("pipe:", format="rawvideo", pix_fmt="rgb24")
-        .compile()
-    )
-    return subprocess.Popen(args, stdout=subprocess.PIPE)
+def start_ffmpeg_reader(
+    in_filename: str,
+    start_time: Optional[float] = None,
+    num_frames: Optional[int] = None,
+    stderr: Optional[int] = None,
+    size: Optional[Tuple[int, int]] = None,
+    fps: Optional[float] = None,
+) -> subprocess.Popen:
+    """ Starts video reader process. If `start_time` (in seconds) is given the input is seeked
+    to that position, if `num_frames` is given only that number of frames are read. The
+    frames are scaled to `size` (width, height) and resampled to `fps` if given """
+    input_kwargs = {} if start_time is None else {"ss": start_time}
+    output_kwargs = {} if num_frames is None else {"vframes": num_frames}
+    stream = ffmpeg.input(in_filename, **input_kwargs)
+    if size is not None:
+        stream = stream.filter("scale", size[0], size[1])
+    if fps is not None:
+        stream = stream.filter("fps", fps=fps)
+    args = stream.output(
+        "pipe:", format="rawvideo", pix_fmt="rgb24", **output_kwargs
+    ).compile()
+    return subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr)
 
 
 def read_frame(
@@ -46,9 +82,286 @@ def read_frame(
     return frame
 
 
+def iter_frames(
+    reader_process: subprocess.Popen, width: int, height: int
+) -> Iterator[NumpyArray]:
+    """ Yields the frames of a reader_process until the end of the stream """
+    while True:
+        frame = read_frame(reader_process, width, height)
+        if frame is None:
+            return
+        yield frame
+
+
+def decode_frames(
+    in_filename: str,
+    width: int,
+    height: int,
+    start_time: Optional[float] = None,
+    num_frames: Optional[int] = None,
+    resize: bool = False,
+    fps: Optional[float] = None,
+) -> Iterator[NumpyArray]:
+    """ Yields the frames of a video, decoded in a separate thread. See `FrameReader` """
+    with FrameReader(
+        in_filename, width, height, start_time, num_frames, resize=resize, fps=fps
+    ) as reader:
+        yield from reader
+
+
+class StderrTail:
+    """ Drains the stderr of a process in a thread, keeping the last lines for errors. An
+    undrained stderr pipe blocks ffmpeg once it is full """
+
+    def __init__(self, process: subprocess.Popen):
+        self.lines = deque(maxlen=STDERR_TAIL_LINES)
+        self.thread = threading.Thread(
+            target=self._drain, args=(process.stderr,), daemon=True
+        )
+        self.thread.start()
+
+    def _drain(self, stderr) -> None:
+        for line in stderr:
+            self.lines.append(line)
+        stderr.close()
+
+    def error(self, message: str) -> ffmpeg.Error:
+        self.thread.join()
+        return ffmpeg.Error(message, None, b"".join(self.lines))
+
+
+class FrameReader:
+    """ Decodes a video in a thread into a bounded queue of frames, iterate it to get the
+    frames. Errors of ffmpeg are raised as `ffmpeg.Error` while iterating. Closing the reader
+    before the end of the video stops ffmpeg. If `resize` the video is scaled to
+    width x height, see `start_ffmpeg_reader` for the rest of the arguments """
+
+    def __init__(
+        self,
+        in_filename: str,
+        width: int,
+        height: int,
+        start_time: Optional[float] = None,
+        num_frames: Optional[int] = None,
+        queue_size: int = FRAME_QUEUE_SIZE,
+        resize: bool = False,
+        fps: Optional[float] = None,
+    ):
+        self.width = width
+        self.height = height
+        self.process = start_ffmpeg_reader(
+            in_filename,
+            start_time,
+            num_frames,
+            stderr=subprocess.PIPE,
+            size=(width, height) if resize else None,
+            fps=fps,
+        )
+        self.stderr = StderrTail(self.process)
+        self.queue = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _put(self, item) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self) -> None:
+        try:
+            for frame in iter_frames(self.process, self.width, self.height):
+                if not self._put(frame):
+                    return
+            if self.process.wait():
+                self._put(self.stderr.error("ffmpeg reader failed"))
+                return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(_END_OF_STREAM)
+
+    def __iter__(self) -> Iterator[NumpyArray]:
+        while True:
+            item = self.queue.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        self.stopped.set()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.thread.join()
+        self.process.stdout.close()
+        self.process.wait()
+
+    def __enter__(self) -> "FrameReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class FrameWriter:
+    """ Encodes frames in a thread, `write` only queues the frame so the encoding overlaps
+    with the glitching. Frames must not be modified after being written. Errors of ffmpeg
+    are raised as `ffmpeg.Error` by `write` or `close` """
+
+    def __init__(
+        self,
+        out_filename: str,
+        width: int,
+        height: int,
+        queue_size: int = FRAME_QUEUE_SIZE,
+        fps: Optional[float] = None,
+    ):
+        self.process = start_ffmpeg_writer(
+            out_filename, width, height, stderr=subprocess.PIPE, fps=fps
+        )
+        self.stderr = StderrTail(self.process)
+        self.queue = queue.Queue(queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def _write(self) -> None:
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is _END_OF_STREAM:
+                    return
+                frame = np.ascontiguousarray(frame.astype(np.uint8, copy=False))
+                self.process.stdin.write(frame.data)
+        except Exception as e:
+            self.error = e
+
+    def _raise_if_failed(self) -> None:
+        if self.error is not None:
+            self.abort()
+            raise self.stderr.error(f"ffmpeg writer failed: {self.error}")
+
+    def write(self, frame: NumpyArray) -> None:
+        while True:
+            self._raise_if_failed()
+            try:
+                self.queue.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> None:
+        """ waits until all the frames are encoded """
+        while self.thread.is_alive():
+            try:
+                self.queue.put(_END_OF_STREAM, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+        self._raise_if_failed()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg already exited, the exit code tells why
+        if self.process.wait():
+            raise self.stderr.error("ffmpeg writer failed")
+
+    def abort(self) -> None:
+        """ stops ffmpeg without waiting for the queued frames """
+        if self.process.poll() is None:
+            self.process.kill()
+        try:
+            # wake up the thread if it is waiting for frames, if it is writing the killed
+            # process makes it fail
+            self.queue.put_nowait(_END_OF_STREAM)
+        except queue.Full:
+            pass
+        self.thread.join()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+
+    def __enter__(self) -> "FrameWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
 def get_video_size(filename: str) -> Tuple[int, int]:
     probe = ffmpeg.probe(filename)
     video_info = next(s for s in probe["streams"] if s["codec_type"] == "video")
     width = int(video_info["width"])
     height = int(video_info["height"])
     return width, height
+
+
+def get_video_info(filename: str) -> dict:
+    """ width, height, fps, duration (in seconds) and num_frames of a video. The number of
+    frames is estimated from the duration if the container does not store it """
+    probe = ffmpeg.probe(filename)
+    video_info = next(s for s in probe["streams"] if s["codec_type"] == "video")
+    num, den = video_info.get("r_frame_rate", "0/1").split("/")
+    fps = float(num) / float(den) if float(den) else 0.0
+    duration = float(
+        video_info.get("duration") or probe.get("format", {}).get("duration") or 0
+    )
+    if video_info.get("nb_frames"):
+        num_frames = int(video_info["nb_frames"])
+    else:
+        num_frames = int(round(duration * fps))
+    return {
+        "width": int(video_info["width"]),
+        "height": int(video_info["height"]),
+        "fps": fps,
+        "duration": duration,
+        "num_frames": num_frames,
+    }
+
+
+def get_frame_times(filename: str) -> Tuple[NumpyArray, NumpyArray]:
+    """ Presentation times (in seconds, relative to the seek origin of the file) of the frames
+    of the video, in display order, and whether each frame is a keyframe. Only the packets are
+    probed, nothing is decoded """
+    probe = ffmpeg.probe(
+        filename, select_streams="v:0", show_entries="packet=pts_time,flags"
+    )
+    packets = [p for p in probe["packets"] if p.get("pts_time", "N/A") != "N/A"]
+    packets.sort(key=lambda p: float(p["pts_time"]))
+
+    # input seeking (-ss) is relative to the start time of the container
+    origin = float(probe.get("format", {}).get("start_time", 0))
+    times = np.asarray([float(p["pts_time"]) for p in packets]) - origin
+    keyframes = np.asarray(["K" in p["flags"] for p in packets], dtype=bool)
+    return times, keyframes
+
+
+def concat_videos(in_filenames: List[str], out_filename: str) -> None:
+    """ Concatenates videos with the same codec parameters using the concat demuxer, the
+    streams are copied without re-encoding """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        for filename in in_filenames:
+            path = os.path.abspath(filename).replace("'", "'\\''")
+            f.write(f"file '{path}'\n")
+        list_filename = f.name
+    try:
+        (
+            ffmpeg.input(list_filename, format="concat", safe=0)
+            .output(out_filename, c="copy")
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    finally:
+        os.remove(list_filename)
@@ -1,7 +1,6 @@
 import os
 import os.path as osp
 import uuid
-import glob
 import shutil
 import hashlib
 import sass
@@ -19,11 +18,16 @@ from flask import (
 from werkzeug.utils import secure_filename
 from itsdangerous import URLSafeSerializer
 from sassutils.wsgi import SassMiddleware
-from random import sample
 
 import requests
+from PIL import Image
 
-from glitch.apps import glitch_image, glitch_video
+from glitch.admission import AdmissionController, JobRejected
+from glitch.apps import glitch_animation, glitch_image, glitch_video
+from glitch.frame_cache import FrameCache
+from glitch.gallery import GalleryIndex
+from glitch.recipe import RECIPE_EXTENSION
+from glitch.video_utils import get_video_info
 
 signer = URLSafeSerializer("super-secret")
 
@@ -33,6 +37,26 @@ ASSETS_FOLDER = "assets"
 
 ALLOWED_EXTENSIONS = {"image": ["png", "jpg", "jpeg"], "video": ["mov", "mp4", "ts"]}
 
+# decoded frames of the uploaded videos, to glitch them again without decoding. Outside
+# STATIC_FOLDER, they must not be served
+FRAME_CACHE_FOLDER = "frame_cache"
+FRAME_CACHE_MAX_BYTES = 4 * 1024 ** 3
+
+# glitched images with animation frames are saved as
+ANIMATION_EXTENSION = "gif"
+ANIMATION_FPS = 15
+
+# uploads bigger than this are rejected
+MAX_UPLOAD_BYTES = 200 * 1024 ** 2
+
+# jobs rendering at the same time and waiting, longer videos are rejected
+MAX_RUNNING_JOBS = 2
+MAX_QUEUED_JOBS = 8
+MAX_VIDEO_FRAMES = 30 * 60 * 5
+
+# index of the uploads and glitches in STATIC_FOLDER
+GALLERY_DB = "gallery.sqlite3"
+
 COMMON_OPTIONS = {
     "noise_intensity": {
         "label": "Noise Intensity",
@@ -76,7 +100,17 @@ COMMON_OPTIONS = {
     },
 }
 
-IMAGE_OPTIONS = {**COMMON_OPTIONS}
+IMAGE_OPTIONS = {
+    **COMMON_OPTIONS,
+    "animation_frames": {
+        "label": "Animation frames (0 for a still image)",
+        "min": 0,
+        "max": 60,
+        "step": 1,
+        "default": 0,
+        "type": int,
+    },
+}
 
 VIDEO_OPTIONS = {
     "min_effect_length": {
@@ -109,6 +143,13 @@ VIDEO_OPTIONS = {
 app = Flask(__name__, static_folder=STATIC_FOLDER)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["SECRET_KEY"] = "1234asdf"
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+ADMISSION = AdmissionController(
+    max_running=MAX_RUNNING_JOBS,
+    max_queued=MAX_QUEUED_JOBS,
+    max_frames=MAX_VIDEO_FRAMES,
+)
 
 # create dirs if needed
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -117,6 +158,14 @@ for media_type in ALLOWED_EXTENSIONS:
     os.makedirs(os.path.join(UPLOAD_FOLDER, media_type), exist_ok=True)
     os.makedirs(os.path.join(STATIC_FOLDER, media_type), exist_ok=True)
 
+rebuild_gallery_index = not osp.exists(GALLERY_DB)
+GALLERY = GalleryIndex(GALLERY_DB)
+if rebuild_gallery_index:
+    # index the files glitched before the index existed
+    GALLERY.rebuild(STATIC_FOLDER, list(ALLOWED_EXTENSIONS))
+
+FRAME_CACHE = FrameCache(FRAME_CACHE_FOLDER, FRAME_CACHE_MAX_BYTES)
+
 # Compile sass
 os.makedirs(f"{STATIC_FOLDER}/css", exist_ok=True)
 
@@ -187,7 +236,8 @@ def glitch(file_type):
         else:
             fname = request.form["filename"]
             file_hash = os.path.basename(fname).split("_")[0]
-            filepath = osp.join(
+            # the glitch can have a different extension, as animations
+            filepath = GALLERY.upload_path(file_type, file_hash) or osp.join(
                 STATIC_FOLDER, file_type, file_hash, f"original.{file_extension(fname)}"
             )
 
@@ -203,14 +253,14 @@ def glitch(file_type):
             )
             shutil.copy(filepath, new_filepath)
             filepath = new_filepath
-            other_glitches = []
-        else:
-            # glitch files are postfixed with -glitch-XX.ext
-            other_glitches = glob.glob(
-                osp.join(STATIC_FOLDER, file_type, file_hash, "*_glitch_*")
-            )
+            GALLERY.add_upload(file_type, file_hash, filepath)
 
-        current_glitch_num = len(other_glitches)
+        other_glitches = GALLERY.history(file_type, file_hash)
+        current_glitch_num = GALLERY.reserve_glitch_num(file_type, file_hash)
+
+        animation_frames = params.get("animation_frames", 0)
+        if animation_frames:
+            extension = ANIMATION_EXTENSION
 
         glitched_fname = f"{file_hash}_glitch_{current_glitch_num}.{extension}"
         glitched_filepath = osp.join(
@@ -219,10 +269,60 @@ def glitch(file_type):
 
         glitched_fname = osp.join(file_type, file_hash, glitched_fname)
 
-        if file_type == "image":
-            glitch_image(filepath, glitched_filepath, **params)
-        elif file_type == "video":
-            glitch_video(filepath, glitched_filepath, **params)
+        video_info, image_info = None, None
+        if file_type == "video":
+            video_info = get_video_info(filepath)
+        else:
+            with Image.open(filepath) as image:  # only reads the header
+                width, height = image.size
+            image_info = {
+                "width": width,
+                "height": height,
+                "num_frames": max(1, animation_frames),
+            }
+        try:
+            with ADMISSION.job(video_info, image_info) as plan:
+                if plan.get("size") or plan.get("fps"):
+                    print(f"Reduced quality: {plan}")
+                recipe_path = glitched_filepath + RECIPE_EXTENSION
+                image_params = {
+                    key: value
+                    for key, value in params.items()
+                    if key != "animation_frames"
+                }
+                if file_type == "image" and animation_frames:
+                    glitch_animation(
+                        filepath,
+                        glitched_filepath,
+                        num_frames=animation_frames,
+                        fps=ANIMATION_FPS,
+                        recipe_path=recipe_path,
+                        # like the still glitches, there is no scanlines option for images
+                        scanlines_intensity=0,
+                        **plan,
+                        **image_params,
+                    )
+                elif file_type == "image":
+                    glitch_image(
+                        filepath,
+                        glitched_filepath,
+                        recipe_path=recipe_path,
+                        **plan,
+                        **image_params,
+                    )
+                elif file_type == "video":
+                    glitch_video(
+                        filepath,
+                        glitched_filepath,
+                        frame_cache=FRAME_CACHE,
+                        recipe_path=recipe_path,
+                        **plan,
+                        **params,
+                    )
+        except JobRejected as e:
+            flash(str(e))
+            return redirect(request.url)
+        GALLERY.add_glitch(file_type, file_hash, current_glitch_num, glitched_filepath)
     else:
         glitched_fname = ""
         other_glitches = []
@@ -243,13 +343,8 @@ NUM_DISPLAYED_GLITCHES = 6
 
 @app.route("/", methods=["GET"])
 def home():
-    images = glob.glob(osp.join(STATIC_FOLDER, "image", "*", "*_glitch_*"))
-    if images:
-        images = sample(images, min(NUM_DISPLAYED_GLITCHES, len(images)))
-
-    videos = glob.glob(osp.join(STATIC_FOLDER, "video", "*", "*_glitch_*"))
-    if videos:
-        videos = sample(videos, min(NUM_DISPLAYED_GLITCHES, len(videos)))
+    images = GALLERY.sample("image", NUM_DISPLAYED_GLITCHES)
+    videos = GALLERY.sample("video", NUM_DISPLAYED_GLITCHES)
 
     return render_template(
         "home.html",
@@ -259,10 +354,27 @@ def home():
     )
 
 
+@app.cli.command("rebuild-gallery")
+def rebuild_gallery():
+    """ index again the uploads and glitches in the static folder """
+    GALLERY.rebuild(STATIC_FOLDER, list(ALLOWED_EXTENSIONS))
+
+
 @app.route("/health_check", methods=["GET"])
 def health_check():
     return jsonify({"state": "running"})
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify(ADMISSION.metrics())
+
+
+@app.errorhandler(413)
+def upload_too_large(error):
+    flash(f"File too large, max is {MAX_UPLOAD_BYTES // 1024 ** 2}MB")
+    return redirect(request.url)
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
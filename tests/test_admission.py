@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from glitch.admission import AdmissionController, JobRejected
+
+
+def video_info(width, height, fps, seconds):
+    return {
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "num_frames": int(fps * seconds),
+    }
+
+
+@pytest.mark.parametrize(
+    "info",
+    [
+        video_info(3840, 2160, 60, 50),
+        video_info(1920, 1080, 30, 120),
+        video_info(640, 480, 25, 10),
+    ],
+)
+def test_idle_videos_keep_their_quality(info):
+    plan = AdmissionController().plan_video(info, depth=0)
+    assert plan == {"size": None, "fps": None}
+
+
+def test_videos_degrade_with_depth():
+    admission = AdmissionController(degrade_every=2)
+    info = video_info(1920, 1080, 60, 20)
+
+    sizes = []
+    for depth in range(8):
+        plan = admission.plan_video(info, depth)
+        width, height = plan["size"] or (info["width"], info["height"])
+        assert width % 2 == 0 and height % 2 == 0
+        assert plan["fps"] is None or plan["fps"] < info["fps"]
+        sizes.append(width)
+
+    assert sizes[:2] == [1920, 1920]
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[-1] <= 640
+
+
+def test_deep_queue_caps_cost():
+    admission = AdmissionController()
+    max_side, max_fps, max_cost = admission.quality_levels[-1]
+    info = video_info(1920, 1080, 30, 280)
+
+    plan = admission.plan_video(info, depth=100)
+
+    width, height = plan["size"]
+    num_frames = info["num_frames"] * plan["fps"] / info["fps"]
+    assert max(width, height) <= max_side
+    assert admission.job_cost(width, height, num_frames) <= max_cost
+
+
+def test_long_videos_are_rejected():
+    admission = AdmissionController(max_frames=100)
+    with pytest.raises(JobRejected):
+        admission.plan_video(video_info(640, 480, 25, 10), depth=0)
+
+
+def test_images():
+    admission = AdmissionController()
+    image = {"width": 4000, "height": 3000, "num_frames": 1}
+    assert admission.plan_image(image, depth=0) == {"size": None}
+
+    plan = admission.plan_image(image, depth=4)
+    assert plan["size"] == (854, 640)
+
+    animation = {"width": 4000, "height": 3000, "num_frames": 60}
+    width, height = admission.plan_image(animation, depth=100)["size"]
+    max_cost = admission.quality_levels[-1][2]
+    assert admission.job_cost(width, height, 60) <= max_cost
+
+
+def test_job_queue_limits_and_metrics():
+    admission = AdmissionController(max_running=1, max_queued=1)
+    started, release = threading.Event(), threading.Event()
+
+    def run():
+        with admission.job(image_info={"width": 1000, "height": 1000, "num_frames": 2}):
+            started.set()
+            release.wait()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait()
+    assert admission.metrics()["running"] == 1
+
+    # one job running and none queued: the next one waits, the one after is rejected
+    def wait():
+        with admission.job():
+            pass
+
+    waiting = threading.Thread(target=wait)
+    waiting.start()
+    while admission.metrics()["queued"] == 0:
+        pass
+    with pytest.raises(JobRejected):
+        with admission.job():
+            pass
+
+    release.set()
+    thread.join()
+    waiting.join()
+    metrics = admission.metrics()
+    assert metrics["accepted"] == 2
+    assert metrics["rejected"] == 1
+    assert metrics["queue_depth"] == 0
+    # the image of 1 megapixel and 2 frames, and the job without info
+    assert metrics["recent_jobs"] == 2
+    assert metrics["recent_mean_cost"] == pytest.approx(1.0)
@@ -0,0 +1,98 @@
+import threading
+
+import imageio
+import numpy as np
+
+from glitch.apps import (
+    glitch_animation,
+    glitch_frames,
+    glitch_image,
+    replay_recipe,
+)
+from glitch.image_glitch import scale_block
+
+
+def make_image(path):
+    rng = np.random.RandomState(0)
+    imageio.imwrite(path, rng.randint(0, 256, (64, 96, 3), np.uint8))
+
+
+def test_glitch_image_same_seed_same_pixels(tmp_path):
+    input_path = str(tmp_path / "input.png")
+    make_image(input_path)
+
+    outputs = []
+    for i in range(3):
+        output_path = str(tmp_path / f"output_{i}.png")
+        glitch_image(input_path, output_path, seed=42)
+        outputs.append(imageio.imread(output_path))
+
+    for output in outputs[1:]:
+        np.testing.assert_array_equal(outputs[0], output)
+
+
+def test_glitch_image_replay_recipe(tmp_path):
+    input_path = str(tmp_path / "input.png")
+    make_image(input_path)
+    output_path = str(tmp_path / "output.png")
+    recipe_path = str(tmp_path / "output.png.recipe")
+    glitch_image(input_path, output_path, recipe_path=recipe_path)
+
+    replay_path = str(tmp_path / "replay.png")
+    replay_recipe(recipe_path, input_path, replay_path)
+
+    np.testing.assert_array_equal(
+        imageio.imread(output_path), imageio.imread(replay_path)
+    )
+
+
+def test_replay_recipe_at_other_size(tmp_path):
+    input_path = str(tmp_path / "input.png")
+    make_image(input_path)
+    output_path = str(tmp_path / "output.png")
+    recipe_path = str(tmp_path / "output.png.recipe")
+    glitch_image(input_path, output_path, recipe_path=recipe_path)
+
+    replay_path = str(tmp_path / "replay.png")
+    replay_recipe(recipe_path, input_path, replay_path, size=(48, 32))
+
+    np.testing.assert_array_equal(
+        scale_block(imageio.imread(output_path), (32, 48), "bilinear"),
+        imageio.imread(replay_path),
+    )
+
+
+def make_frames(num_frames, shape=(48, 64, 3)):
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 256, shape, np.uint8) for _ in range(num_frames)]
+
+
+def test_glitch_frames_concurrent_renders_do_not_interfere():
+    frames = make_frames(100)
+    expected = [frame.copy() for frame in glitch_frames(iter(frames), 11)]
+
+    outputs = {}
+
+    def render(seed):
+        outputs[seed] = [frame.copy() for frame in glitch_frames(iter(frames), seed)]
+
+    threads = [threading.Thread(target=render, args=(seed,)) for seed in [11, 99]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for frame, output in zip(expected, outputs[11]):
+        np.testing.assert_array_equal(frame, output)
+
+
+def test_glitch_animation_small_image(tmp_path):
+    input_path = str(tmp_path / "input.png")
+    rng = np.random.RandomState(0)
+    imageio.imwrite(input_path, rng.randint(0, 256, (64, 64, 3), np.uint8))
+
+    for seed in range(20):
+        output_path = str(tmp_path / f"output_{seed}.gif")
+        glitch_animation(
+            input_path, output_path, num_frames=30, seed=seed, channels_movement=1.0
+        )
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+
+from glitch.frame_cache import FrameCache
+
+FRAME_SHAPE = (4, 6, 3)
+FRAME_BYTES = int(np.prod(FRAME_SHAPE))
+
+
+def make_video(tmp_path, name):
+    # the cache only stats the video, it never reads it
+    path = tmp_path / f"{name}.mp4"
+    path.write_bytes(name.encode())
+    return str(path)
+
+
+def make_frames(value, num_frames=10):
+    return [np.full(FRAME_SHAPE, value, np.uint8) for _ in range(num_frames)]
+
+
+def set_last_use(cache, video_path, timestamp):
+    _, meta_path = cache._paths(cache._video_dir(video_path))
+    os.utime(meta_path, (timestamp, timestamp))
+
+
+def test_store_and_get(tmp_path):
+    cache = FrameCache(str(tmp_path / "cache"), 100 * FRAME_BYTES)
+    video_path = make_video(tmp_path, "a")
+    assert cache.get(video_path) is None
+
+    frames = make_frames(7)
+    stored = list(cache.store(video_path, frames))
+
+    assert len(stored) == len(frames)
+    cached = cache.get(video_path)
+    assert cached.shape == (len(frames),) + FRAME_SHAPE
+    np.testing.assert_array_equal(cached, np.stack(frames))
+
+
+def test_store_incomplete_or_too_big(tmp_path):
+    cache = FrameCache(str(tmp_path / "cache"), 5 * FRAME_BYTES)
+    video_path = make_video(tmp_path, "a")
+
+    # too big: all the frames are yielded but not cached
+    assert len(list(cache.store(video_path, make_frames(1)))) == 10
+    assert cache.get(video_path) is None
+
+    # not consumed till the end
+    frames = cache.store(video_path, make_frames(1, 3))
+    next(frames)
+    frames.close()
+    assert cache.get(video_path) is None
+    assert cache.entries() == []
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = FrameCache(str(tmp_path / "cache"), 25 * FRAME_BYTES)
+    videos = [make_video(tmp_path, name) for name in "abc"]
+
+    for i, video_path in enumerate(videos[:2]):
+        list(cache.store(video_path, make_frames(i)))
+        set_last_use(cache, video_path, 1000 + i)
+    # a was used after b
+    set_last_use(cache, videos[0], 2000)
+
+    list(cache.store(videos[2], make_frames(2)))
+
+    assert cache.get(videos[0]) is not None
+    assert cache.get(videos[1]) is None
+    assert cache.get(videos[2]) is not None
+    assert sum(size for _, size, _ in cache.entries()) <= cache.max_bytes
+
+
+def test_changed_video_is_not_cached(tmp_path):
+    cache = FrameCache(str(tmp_path / "cache"), 100 * FRAME_BYTES)
+    video_path = make_video(tmp_path, "a")
+    list(cache.store(video_path, make_frames(1)))
+
+    with open(video_path, "ab") as f:
+        f.write(b"changed")
+    assert cache.get(video_path) is None
+
+
+def test_evicted_concurrently(tmp_path):
+    cache = FrameCache(str(tmp_path / "cache"), 100 * FRAME_BYTES)
+    video_path = make_video(tmp_path, "a")
+    list(cache.store(video_path, make_frames(1)))
+
+    # frames removed by another render after the metadata was read
+    frames_path, meta_path = cache._paths(cache._video_dir(video_path))
+    os.remove(frames_path)
+    assert cache.get(video_path) is None
+    assert cache.entries() == []
+
+    os.remove(meta_path)
+    assert cache.get(video_path) is None
+
+
+def test_evict_entries_removed_concurrently(tmp_path, monkeypatch):
+    cache = FrameCache(str(tmp_path / "cache"), 100 * FRAME_BYTES)
+    video_path = make_video(tmp_path, "a")
+    list(cache.store(video_path, make_frames(1)))
+    entries = cache.entries()
+
+    # another render evicts the entry after this one listed it
+    cache.evict(0)
+    assert cache.get(video_path) is None
+    monkeypatch.setattr(cache, "entries", lambda: entries)
+    cache.evict(0)
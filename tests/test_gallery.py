@@ -0,0 +1,102 @@
+import threading
+from collections import Counter
+
+import pytest
+
+from glitch.gallery import GalleryIndex
+
+
+@pytest.fixture
+def gallery(tmp_path):
+    return GalleryIndex(str(tmp_path / "gallery.sqlite3"))
+
+
+def add_glitches(gallery, file_type, file_hash, count):
+    paths = []
+    for _ in range(count):
+        num = gallery.reserve_glitch_num(file_type, file_hash)
+        path = f"{file_type}/{file_hash}/{file_hash}_glitch_{num}.png"
+        gallery.add_glitch(file_type, file_hash, num, path)
+        paths.append(path)
+    return paths
+
+
+def seqs(gallery, file_type):
+    with gallery._connect() as conn:
+        rows = conn.execute(
+            "SELECT seq FROM glitches WHERE file_type = ? AND seq IS NOT NULL",
+            (file_type,),
+        ).fetchall()
+    return sorted(seq for (seq,) in rows)
+
+
+def test_seq_is_dense_per_type(gallery):
+    # interleaved types, so their ids have gaps
+    for i in range(5):
+        add_glitches(gallery, "image", f"i{i}", 2)
+        add_glitches(gallery, "video", f"v{i}", 3)
+    # replacing a glitch keeps its seq
+    gallery.add_glitch("image", "i0", 0, "replaced.png")
+
+    assert seqs(gallery, "image") == list(range(10))
+    assert seqs(gallery, "video") == list(range(15))
+
+
+def test_sample_is_uniform(gallery):
+    images = add_glitches(gallery, "image", "a", 1)
+    add_glitches(gallery, "video", "b", 50)
+    images += add_glitches(gallery, "image", "c", 3)
+
+    counts = Counter(path for _ in range(4000) for path in gallery.sample("image", 1))
+
+    assert set(counts) == set(images)
+    for count in counts.values():
+        assert 800 < count < 1200
+
+
+def test_sample_count(gallery):
+    assert gallery.sample("image", 3) == []
+    paths = add_glitches(gallery, "image", "a", 5)
+
+    sample = gallery.sample("image", 3)
+    assert len(sample) == len(set(sample)) == 3
+    assert sorted(gallery.sample("image", 10)) == sorted(paths)
+
+
+def test_reserved_glitch_nums_are_unique(gallery):
+    nums = []
+    threads = [
+        threading.Thread(
+            target=lambda: nums.append(gallery.reserve_glitch_num("image", "a"))
+        )
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(nums) == list(range(20))
+    # reserved glitches are not shown until they are added
+    assert gallery.history("image", "a") == []
+    assert gallery.sample("image", 5) == []
+
+
+def test_rebuild(gallery, tmp_path):
+    static_folder = tmp_path / "static"
+    hash_folder = static_folder / "image" / "abc"
+    hash_folder.mkdir(parents=True)
+    for filename in ["original.png", "abc_glitch_0.png", "abc_glitch_1.gif"]:
+        (hash_folder / filename).write_bytes(b"")
+    add_glitches(gallery, "image", "gone", 2)
+
+    gallery.rebuild(str(static_folder), ["image", "video"])
+
+    assert gallery.upload_path("image", "abc") == str(hash_folder / "original.png")
+    assert gallery.history("image", "abc") == [
+        str(hash_folder / "abc_glitch_0.png"),
+        str(hash_folder / "abc_glitch_1.gif"),
+    ]
+    assert gallery.history("image", "gone") == []
+    assert seqs(gallery, "image") == [0, 1]
+    assert gallery.reserve_glitch_num("image", "abc") == 2
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from glitch.image_glitch import INTERPOLATIONS, scale_block, swap_block_arbitrary_size
+
+
+def make_block(shape=(12, 20, 3)):
+    return np.random.RandomState(0).randint(0, 256, shape, np.uint8)
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+@pytest.mark.parametrize("size", [(24, 40), (5, 7), (12, 3), (1, 1)])
+def test_scale_block_shape_and_range(interpolation, size):
+    block = make_block()
+    scaled = scale_block(block, size, interpolation)
+
+    assert scaled.shape == size + (3,)
+    assert scaled.dtype == np.uint8
+    assert block.min() <= scaled.min() and scaled.max() <= block.max()
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+def test_scale_block_same_size_and_constant(interpolation):
+    block = make_block()
+    assert scale_block(block, block.shape[:2], interpolation) is block
+
+    constant = np.full((6, 9, 3), 255, np.uint8)
+    np.testing.assert_array_equal(
+        scale_block(constant, (13, 4), interpolation), np.full((13, 4, 3), 255)
+    )
+
+
+def test_scale_block_nearest_upscale_repeats_pixels():
+    block = make_block((3, 4, 3))
+    np.testing.assert_array_equal(
+        scale_block(block, (6, 8), "nearest"), block.repeat(2, axis=0).repeat(2, axis=1)
+    )
+
+
+def test_scale_block_invalid_interpolation():
+    with pytest.raises(ValueError):
+        scale_block(make_block(), (4, 4), "bicubic")
+
+
+@pytest.mark.parametrize("interpolation", INTERPOLATIONS)
+@pytest.mark.parametrize(
+    "origin_block, dst_block",
+    [
+        ((0, 0, 10, 10), (20, 20, 10, 10)),  # disjoint
+        ((0, 0, 12, 12), (6, 6, 12, 12)),  # overlapping
+        ((2, 4, 8, 16), (10, 3, 20, 6)),  # different sizes
+    ],
+)
+def test_swap_block_arbitrary_size_in_place(interpolation, origin_block, dst_block):
+    arr = make_block((40, 40, 3))
+    # swapping into the same array must read both blocks before writing any of them
+    expected = swap_block_arbitrary_size(
+        arr.copy(), arr.copy(), origin_block, dst_block, interpolation=interpolation
+    )
+    in_place = arr.copy()
+    swap_block_arbitrary_size(
+        in_place, in_place, origin_block, dst_block, interpolation=interpolation
+    )
+    np.testing.assert_array_equal(in_place, expected)
@@ -0,0 +1,70 @@
+import numpy as np
+
+from glitch.apps import glitch_frames
+from glitch.segments import plan_segments, segment_key
+
+
+def make_frames(num_frames, shape=(36, 48, 3)):
+    rng = np.random.RandomState(0)
+    return [rng.randint(0, 256, shape, np.uint8) for _ in range(num_frames)]
+
+
+def test_plan_segments_starts_at_keyframes():
+    frame_times = np.arange(300) / 30
+    keyframes = np.zeros(300, bool)
+    keyframes[::40] = True
+
+    segments = plan_segments(frame_times, keyframes, min_segment_frames=50)
+
+    assert [(s["start"], s["end"]) for s in segments] == [
+        (0, 80),
+        (80, 160),
+        (160, 240),
+        (240, 300),
+    ]
+    assert segments[0]["start_time"] is None
+    for segment in segments[1:]:
+        start = segment["start"]
+        assert frame_times[start - 1] < segment["start_time"] < frame_times[start]
+
+
+def test_segments_match_full_render():
+    frames = make_frames(200)
+    overrides = [(30, 120, {"noise_intensity": 1.0, "scanlines_intensity": 0})]
+    params = {"scanlines_intensity": 0.3, "channels_movement": 0.8}
+    full = list(glitch_frames(iter(frames), 7, overrides=overrides, **params))
+
+    keyframes = np.zeros(len(frames), bool)
+    keyframes[::25] = True
+    segments = plan_segments(np.arange(len(frames)) / 25, keyframes, 50)
+    assert len(segments) > 1
+
+    rendered = []
+    for segment in segments:
+        rendered += glitch_frames(
+            iter(frames[segment["start"] : segment["end"]]),
+            7,
+            start_frame=segment["start"],
+            overrides=overrides,
+            **params,
+        )
+
+    assert len(rendered) == len(full)
+    for frame, segment_frame in zip(full, rendered):
+        np.testing.assert_array_equal(frame, segment_frame)
+
+
+def test_segment_key():
+    segment = {"start": 100, "end": 200}
+    key = segment_key("abc", segment, 7, {"noise_amount": 0.2})
+
+    assert key == segment_key("abc", dict(segment), 7, {"noise_amount": 0.2})
+    assert key != segment_key("abc", segment, 8, {"noise_amount": 0.2})
+    assert key != segment_key("abd", segment, 7, {"noise_amount": 0.2})
+    # overrides outside the segment do not change it
+    assert key == segment_key(
+        "abc", segment, 7, {"noise_amount": 0.2}, [(0, 50, {"noise_amount": 1.0})]
+    )
+    assert key != segment_key(
+        "abc", segment, 7, {"noise_amount": 0.2}, [(150, 250, {"noise_amount": 1.0})]
+    )